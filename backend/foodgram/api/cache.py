@@ -0,0 +1,131 @@
+import hashlib
+import time
+
+from core.params import UrlParams
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+PAGE_PARAMS = ("page", "limit")
+FILTER_PARAMS = (
+    UrlParams.TAGS.value,
+    UrlParams.TAGS_MODE.value,
+    UrlParams.AUTHOR.value,
+)
+
+
+class RecipeListCache:
+    """
+    Кэш сериализованных страниц списка рецептов для анонимных пользователей.
+
+    Ключ страницы строится из нормализованных параметров фильтра и
+    поколений (generation) данных, от которых она зависит:
+    общего поколения, поколения каждого тега из фильтра, поколения автора
+    из фильтра, либо поколения всех рецептов для списка без фильтров.
+    Инвалидация сводится к смене поколения, старые страницы вытесняются
+    по TTL.
+    """
+
+    prefix = "recipes_list"
+
+    @property
+    def cache(self):
+        return caches[settings.RECIPES_LIST_CACHE]
+
+    def get_key(self, request):
+        """Ключ страницы или None, если ответ нельзя кэшировать"""
+
+        params = request.query_params
+        if (
+            not settings.RECIPES_LIST_CACHE_TTL
+            or request.user.is_authenticated
+            or set(params) - set(PAGE_PARAMS + FILTER_PARAMS)
+        ):
+            return None
+
+        tags = sorted(set(params.getlist(UrlParams.TAGS.value)))
+        author = params.get(UrlParams.AUTHOR.value)
+
+        generations = ["global"]
+        generations += [f"tag:{slug}" for slug in tags]
+        if author:
+            generations.append(f"author:{author}")
+        if not tags and not author:
+            generations.append("all")
+
+        signature = [
+            request.get_host(),
+            *(f"{name}={params.get(name)}" for name in PAGE_PARAMS),
+            f"tags={','.join(tags)}",
+            f"tags_mode={params.get(UrlParams.TAGS_MODE.value)}",
+            f"author={author}",
+            *self.get_generations(generations),
+        ]
+        digest = hashlib.md5("|".join(signature).encode()).hexdigest()
+        return f"{self.prefix}:page:{digest}"
+
+    def get_generations(self, names):
+        """Текущие поколения, отсутствующие в кэше создаются заново"""
+
+        keys = [f"{self.prefix}:gen:{name}" for name in names]
+        generations = self.cache.get_many(keys)
+        missing = {
+            key: time.time_ns() for key in keys if key not in generations
+        }
+        if missing:
+            self.cache.set_many(missing, None)
+            generations.update(missing)
+        return [str(generations[key]) for key in keys]
+
+    def get(self, key):
+        data = self.cache.get(key)
+        self.count("hits" if data is not None else "misses")
+        return data
+
+    def set(self, key, data):
+        self.cache.set(key, data, settings.RECIPES_LIST_CACHE_TTL)
+
+    def count(self, name):
+        key = f"{self.prefix}:stats:{name}"
+        self.cache.add(key, 0, None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Счетчик вытеснен между add и incr
+            pass
+
+    def stats(self):
+        """Счетчики попаданий и промахов кэша"""
+
+        keys = {
+            name: f"{self.prefix}:stats:{name}" for name in ("hits", "misses")
+        }
+        values = self.cache.get_many(keys.values())
+        return {name: values.get(key, 0) for name, key in keys.items()}
+
+    def invalidate(self, tags=(), authors=(), everything=False):
+        """
+        Смена поколений после фиксации транзакции, чтобы в кэш
+        не попали страницы с еще не сохраненными данными
+        """
+
+        names = ["global"] if everything else ["all"]
+        names += [f"tag:{slug}" for slug in tags]
+        names += [f"author:{author}" for author in authors]
+        keys = [f"{self.prefix}:gen:{name}" for name in names]
+
+        transaction.on_commit(
+            lambda: self.cache.set_many(
+                dict.fromkeys(keys, time.time_ns()), None
+            )
+        )
+
+    def invalidate_recipe(self, recipe, tags=None):
+        """Инвалидация страниц, на которых может находиться рецепт"""
+
+        if tags is None:
+            tags = recipe.tags.values_list("slug", flat=True)
+        self.invalidate(tags=list(tags), authors=(recipe.author_id,))
+
+
+recipe_list_cache = RecipeListCache()
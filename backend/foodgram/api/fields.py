@@ -0,0 +1,47 @@
+import io
+
+from django import forms
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+THUMBNAIL = "thumbnail"
+DETAIL = "detail"
+
+
+class RecipeImageField(Base64ImageField):
+    """
+    Картинка рецепта в base64.
+
+    При приеме Pillow проверяет заголовок и структуру файла без
+    декодирования пикселей, полная обработка и уменьшение выполняются в
+    фоне (core.images). При выдаче
+    отдается вариант картинки: миниатюра для списка, крупная картинка
+    для остальных действий, пока вариант не построен - оригинал
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        # Без полной проверки Pillow, она выполняется при обработке
+        kwargs.setdefault("_DjangoImageField", forms.FileField)
+        super().__init__(**kwargs)
+
+    def get_file_extension(self, filename, decoded_file):
+        extension = super().get_file_extension(filename, decoded_file)
+        try:
+            Image.open(io.BytesIO(decoded_file)).verify()
+        except Exception:
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        return extension
+
+    def get_variant(self):
+        if self.variant is not None:
+            return self.variant
+        view = self.context.get("view")
+        if getattr(view, "action", None) == "list":
+            return THUMBNAIL
+        return DETAIL
+
+    def get_attribute(self, instance):
+        image = super().get_attribute(instance)
+        return getattr(instance, f"image_{self.get_variant()}", None) or image
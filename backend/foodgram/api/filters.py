@@ -1,37 +1,93 @@
 import django_filters.rest_framework as filters
-from core.params import UrlParams
-from recipes.models import Ingredient, Recipes
+from core.params import TAGS_MODE_ALL, UrlParams
+from django.db.models import BooleanField, Case, Exists, OuterRef, Value, When
+from recipes.models import Recipes, Tags
+from rest_framework.filters import BaseFilterBackend
 
 
 # ----------------Поисковой фильтр ингридиентов----------------
-class IngredientsFilter(filters.FilterSet):
-    """Фильтр для ингридиентов"""
+class IngredientSearchFilter(BaseFilterBackend):
+    """
+    Поиск ингридиентов по вхождению строки в название.
+    Совпадения с начала строки отдаются раньше остальных.
+    На Postgres поиск использует триграммный GIN индекс по UPPER(name)
+    """
 
-    name = filters.CharFilter(field_name="name", lookup_expr="istartswith")
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(UrlParams.NAME.value)
+        if not name:
+            return queryset
+        return self.search(queryset, name)
 
-    class Meta:
-        model = Ingredient
-        fields = ("name",)
+    @staticmethod
+    def search(queryset, name):
+        """Отбирает ингридиенты по вхождению name в название"""
+
+        return (
+            queryset.filter(name__icontains=name)
+            .annotate(
+                is_prefix=Case(
+                    When(name__istartswith=name, then=Value(True)),
+                    default=Value(False),
+                    output_field=BooleanField(),
+                )
+            )
+            .order_by("-is_prefix", "name")
+        )
 
 
 # ----------------Фильтр класс для рецептов----------------
 class RcipeFilter(filters.FilterSet):
-    tags = filters.CharFilter(field_name="tags__slug", distinct=True)
+    """
+    Фильтр рецептов. Теги передаются несколькими параметрами tags,
+    при tags_mode=all рецепт должен иметь все теги, иначе хотя бы один.
+    Теги проверяются подзапросами EXISTS по таблице связей, без DISTINCT
+    """
+
+    tags = filters.CharFilter(method="filter_tags")
     author = filters.CharFilter(field_name="author", lookup_expr="exact")
     is_in_shopping_cart = filters.CharFilter(
-        method="filter_by_boolean", field_name="in_shopping_list__user"
+        method="filter_by_boolean", field_name="is_in_shopping_cart"
     )
     is_favorited = filters.CharFilter(
-        method="filter_by_boolean", field_name="selected_recipes__user"
+        method="filter_by_boolean", field_name="is_favorited"
     )
 
     class Meta:
         model = Recipes
         fields = ("tags", "author", "is_in_shopping_cart", "is_favorited")
 
+    def filter_tags(self, queryset, name, value):
+        slugs = set(self.data.getlist(UrlParams.TAGS.value))
+        recipe_tags = Recipes.tags.through.objects.filter(
+            recipes=OuterRef("pk")
+        )
+
+        if self.data.get(UrlParams.TAGS_MODE.value) == TAGS_MODE_ALL:
+            for slug in slugs:
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tags__slug=slug))
+                )
+            return queryset
+
+        return queryset.filter(
+            Exists(
+                recipe_tags.filter(
+                    tags__in=Tags.objects.filter(slug__in=slugs).values("pk")
+                )
+            )
+        )
+
     def filter_by_boolean(self, queryset, name, value):
-        if value == UrlParams.IS_TRUE.value:
-            return queryset.filter(**{name: self.request.user})
-        if value == UrlParams.IS_FALSE.value:
-            return queryset.exclude(**{name: self.request.user})
-        return queryset
+        """
+        Фильтр по признакам избранного и списка покупок, вычисленным
+        аннотациями в представлении. У анонимного пользователя
+        избранного и списка покупок нет
+        """
+        if value not in (UrlParams.IS_TRUE.value, UrlParams.IS_FALSE.value):
+            return queryset
+        if self.request.user.is_anonymous:
+            if value == UrlParams.IS_TRUE.value:
+                return queryset.none()
+            return queryset
+        return queryset.filter(**{name: value == UrlParams.IS_TRUE.value})
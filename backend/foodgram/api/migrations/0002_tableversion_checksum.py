@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tableversion',
+            name='checksum',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Контрольная сумма загруженного файла'),
+        ),
+    ]
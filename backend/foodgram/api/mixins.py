@@ -1,31 +1,267 @@
-from django.db.models import Q
+import hashlib
+from calendar import timegm
+
+from core.params import USER_VERSION
+from django.db import IntegrityError, connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal
 from django.shortcuts import get_object_or_404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers, quote_etag)
+from django.utils.http import http_date
 from rest_framework import status
 from rest_framework.response import Response
 
+from .models import TableVersion
+from .serializers import BulkRelationsSerializer
+
+# Отправляется после пакетного изменения связей вместо post_save и
+# post_delete для каждой записи, аргументы: user_id, added, removed
+relations_bulk_changed = Signal()
+
+
+def insert_relations(model, field_name, user_id, object_ids):
+    """
+    Создает связи пользователя с объектами одним запросом
+    INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Возвращает пары (pk, id объекта) только созданных записей
+    """
+    if not object_ids:
+        return []
+    using = router.db_for_write(model)
+    opts = model._meta
+    quote_name = connections[using].ops.quote_name
+    object_column = quote_name(opts.get_field(field_name).column)
+    values = ", ".join(["(%s, %s)"] * len(object_ids))
+    sql = (
+        f"INSERT INTO {quote_name(opts.db_table)} "
+        f"({quote_name(opts.get_field('user').column)}, {object_column}) "
+        f"VALUES {values} ON CONFLICT DO NOTHING "
+        f"RETURNING {quote_name(opts.pk.column)}, {object_column}"
+    )
+    params = [value for idx in object_ids for value in (user_id, idx)]
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def delete_relations(model, field_name, user_id, object_ids):
+    """
+    Удаляет связи пользователя с объектами одним запросом
+    DELETE ... RETURNING.
+    Возвращает пары (pk, id объекта) удаленных записей
+    """
+    if not object_ids:
+        return []
+    using = router.db_for_write(model)
+    opts = model._meta
+    quote_name = connections[using].ops.quote_name
+    object_column = quote_name(opts.get_field(field_name).column)
+    placeholders = ", ".join(["%s"] * len(object_ids))
+    sql = (
+        f"DELETE FROM {quote_name(opts.db_table)} "
+        f"WHERE {quote_name(opts.get_field('user').column)} = %s "
+        f"AND {object_column} IN ({placeholders}) "
+        f"RETURNING {quote_name(opts.pk.column)}, {object_column}"
+    )
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, [user_id, *object_ids])
+        return cursor.fetchall()
+
 
 class AddManyToManyFieldMixin:
-    """Добавление, удаление данных ManyToManyField для моделей"""
+    """
+    Добавление, удаление данных ManyToManyField для моделей.
+    Связь создается и удаляется одним запросом с опорой на уникальное
+    ограничение (user, поле), поэтому одновременные запросы не создают
+    дублей. Сигналы post_save и post_delete отправляются вручную
+    """
 
     serializers_for_mixin = None
 
-    def delete_create_many_to_many(
-        self, object_idx, model_object, filters_object
-    ):
+    def delete_create_many_to_many(self, object_idx, model_object, field_name):
         object_data = get_object_or_404(self.queryset, id=object_idx)
-        connections = model_object.objects.filter(
-            Q(user=self.request.user) & filters_object
-        )
-        serializer = self.serializers_for_mixin(object_data)
+        user_id = self.request.user.id
+        using = router.db_for_write(model_object)
 
-        if (self.request.method in ("POST",)) and not connections:
-            model_object(None, object_data.id, self.request.user.id).save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if self.request.method in ("POST",):
+            try:
+                with transaction.atomic(using=using):
+                    rows = insert_relations(
+                        model_object, field_name, user_id, [object_data.id]
+                    )
+                    for pk, idx in rows:
+                        post_save.send(
+                            sender=model_object,
+                            instance=model_object(
+                                pk=pk,
+                                user_id=user_id,
+                                **{f"{field_name}_id": idx},
+                            ),
+                            created=True,
+                            update_fields=None,
+                            raw=False,
+                            using=using,
+                        )
+            except IntegrityError:
+                # Нарушены другие ограничения, например подписка на себя
+                rows = None
+            if rows:
+                serializer = self.serializers_for_mixin(object_data)
+                return Response(
+                    serializer.data, status=status.HTTP_201_CREATED
+                )
 
-        if (self.request.method in ("DELETE",)) and connections:
-            connections[0].delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+        if self.request.method in ("DELETE",):
+            with transaction.atomic(using=using):
+                rows = delete_relations(
+                    model_object, field_name, user_id, [object_data.id]
+                )
+                for pk, idx in rows:
+                    post_delete.send(
+                        sender=model_object,
+                        instance=model_object(
+                            pk=pk, user_id=user_id, **{f"{field_name}_id": idx}
+                        ),
+                        using=using,
+                    )
+            if rows:
+                return Response(status=status.HTTP_204_NO_CONTENT)
 
         return Response(
             {"error": "object exist"}, status=status.HTTP_400_BAD_REQUEST
         )
+
+    def bulk_many_to_many(self, model_object, field_name, queryset=None):
+        """
+        Пакетное добавление и удаление связей. Все id проверяются одним
+        запросом pk__in, затем выполняются один INSERT и один DELETE.
+        Вместо сигналов для каждой записи отправляется
+        relations_bulk_changed
+        """
+        serializer = BulkRelationsSerializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        add = serializer.validated_data["add"]
+        remove = serializer.validated_data["remove"]
+
+        if queryset is None:
+            queryset = self.queryset
+        requested = set(add) | set(remove)
+        found = set(
+            queryset.filter(pk__in=requested)
+            .order_by()
+            .values_list("pk", flat=True)
+        )
+        missing = sorted(requested - found)
+        if missing:
+            return Response(
+                {"error": "objects not found", "ids": missing},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_id = self.request.user.id
+        using = router.db_for_write(model_object)
+        try:
+            with transaction.atomic(using=using):
+                added = [
+                    idx
+                    for _, idx in insert_relations(
+                        model_object, field_name, user_id, add
+                    )
+                ]
+                removed = [
+                    idx
+                    for _, idx in delete_relations(
+                        model_object, field_name, user_id, remove
+                    )
+                ]
+                if added or removed:
+                    relations_bulk_changed.send(
+                        sender=model_object,
+                        user_id=user_id,
+                        added=added,
+                        removed=removed,
+                    )
+        except IntegrityError:
+            return Response(
+                {"error": "invalid relation"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response({"added": sorted(added), "removed": sorted(removed)})
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET запросы для list и retrieve.
+    ETag и Last-Modified строятся по адресу запроса, формату ответа и
+    счетчикам версий из get_version_names, при совпадении клиент
+    получает ответ 304 без формирования данных
+    """
+
+    version_names = ()
+    conditional_actions = ("list", "retrieve")
+    # Ответ зависит от пользователя (например, is_favorited), к версиям
+    # добавляется версия признаков пользователя
+    vary_on_user = False
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.conditional_actions:
+            return handler(request, *args, **kwargs)
+
+        versions = TableVersion.objects.filter(
+            name__in=self.get_version_names()
+        ).order_by("name")
+        parts = [request.get_full_path(), request.accepted_renderer.format]
+        parts += [f"{item.name}{item.version}" for item in versions]
+        if self.vary_on_user:
+            parts.append(request.user.pk or 0)
+
+        etag = quote_etag(
+            hashlib.md5(
+                "-".join(str(part) for part in parts).encode()
+            ).hexdigest()
+        )
+        last_modified = max(
+            (timegm(item.updated.utctimetuple()) for item in versions),
+            default=None,
+        )
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK,
+            status.HTTP_304_NOT_MODIFIED,
+        ):
+            response["ETag"] = etag
+            if last_modified:
+                response["Last-Modified"] = http_date(last_modified)
+
+        patch_cache_control(response, no_cache=True)
+        if self.vary_on_user:
+            patch_vary_headers(response, ("Authorization",))
+        return response
+
+    def get_version_names(self):
+        """Названия счетчиков версий, от которых зависит ответ"""
+
+        names = list(self.version_names)
+        user = self.request.user
+        if self.vary_on_user and user.is_authenticated:
+            names.append(USER_VERSION.format(user.pk))
+        return names
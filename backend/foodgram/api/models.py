@@ -0,0 +1,94 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class TableVersion(models.Model):
+    """
+    Счетчик версий данных. Увеличивается при каждом изменении
+    соответствующих таблиц или отдельной записи (рецепта, данных
+    пользователя) и используется для построения ETag
+    """
+
+    name = models.CharField(
+        max_length=50, primary_key=True, verbose_name="Название"
+    )
+    version = models.PositiveBigIntegerField(
+        default=0, verbose_name="Версия"
+    )
+    updated = models.DateTimeField(
+        default=timezone.now, verbose_name="Время изменения"
+    )
+    checksum = models.CharField(
+        max_length=64,
+        blank=True,
+        verbose_name="Контрольная сумма загруженного файла",
+    )
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+    @classmethod
+    def bump(cls, *names):
+        """
+        Увеличивает версии с указанными названиями одним запросом,
+        отсутствующие версии создаются вторым
+        """
+
+        names = set(names)
+        if not names:
+            return
+        now = timezone.now()
+        updated = cls.objects.filter(name__in=names).update(
+            version=F("version") + 1, updated=now
+        )
+        if updated < len(names):
+            cls.objects.bulk_create(
+                (cls(name=name, version=1, updated=now) for name in names),
+                ignore_conflicts=True,
+            )
+
+
+class StoredFile(models.Model):
+    """
+    Файл хранилища с именем по содержимому (core.storage).
+    Строка блокируется до конца транзакции при сохранении файла и при
+    его удалении: удаление ждет, пока рецепт, получивший ссылку на
+    существующий файл, будет сохранен, и видит эту ссылку
+    """
+
+    name = models.CharField(
+        max_length=255, primary_key=True, verbose_name="Имя файла"
+    )
+
+    class Meta:
+        verbose_name = "Файл"
+        verbose_name_plural = "Файлы"
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def lock(cls, *names):
+        """
+        Блокирует строки файлов до конца текущей транзакции, недостающие
+        строки создаются. Строка, удаленная другой транзакцией во время
+        ожидания блокировки, создается заново
+        """
+
+        names = sorted(set(names))
+        while names:
+            cls.objects.bulk_create(
+                (cls(name=name) for name in names), ignore_conflicts=True
+            )
+            locked = set(
+                cls.objects.select_for_update()
+                .filter(name__in=names)
+                .order_by("name")
+                .values_list("name", flat=True)
+            )
+            names = [name for name in names if name not in locked]
@@ -1,6 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import partial
+
+from core.params import UrlParams
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CountPaginator(Paginator):
+    """Paginator с заранее вычисленным общим количеством"""
+
+    def __init__(self, *args, count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.known_count = count
+
+    @cached_property
+    def count(self):
+        if self.known_count is not None:
+            return self.known_count
+        return super().count
+
+
+def exact_count(queryset):
+    """Точное количество записей"""
+    return queryset.count()
+
+
+def cached_count(queryset):
+    """
+    Количество записей, кэшируемое по сигнатуре запроса
+    (SQL с параметрами фильтра) на COUNT_CACHE_TTL секунд.
+    Заведомо пустой запрос (none(), pk__in=[]) не компилируется в SQL
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0
+    signature = hashlib.md5(sql.encode()).hexdigest()
+    key = f'count:{queryset.model._meta.label}:{signature}'
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, settings.COUNT_CACHE_TTL)
+    return count
+
+
+def estimated_count(queryset):
+    """
+    Для запроса без фильтров - оценка количества строк таблицы из
+    статистики Postgres (pg_class.reltuples), если она больше
+    COUNT_ESTIMATE_THRESHOLD. Запросы с фильтрами, небольшие таблицы и
+    другие базы данных получают точное количество
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return queryset.count()
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+
+    # До первого ANALYZE reltuples равен -1 (или 0 в старых версиях)
+    if row and row[0] > settings.COUNT_ESTIMATE_THRESHOLD:
+        return row[0]
+    return queryset.count()
 
 
 class PageLimitPagination(PageNumberPagination):
-    """Пагинатор с определением атрибута"""
+    """
+    Пагинатор с определением атрибута.
+
+    Способ подсчета общего количества задается атрибутом count_strategy
+    представления: exact, cached или estimate.
+
+    С параметром cursor включается keyset пагинация: следующая страница
+    выбирается условием по полям cursor_ordering представления
+    относительно последней записи, без OFFSET и подсчета общего количества
+    """
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_ordering = ('id',)
+    invalid_cursor_message = 'Invalid cursor'
+    count_strategy = 'exact'
+    count_strategies = {
+        'exact': exact_count,
+        'cached': cached_count,
+        'estimate': estimated_count,
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = None
+        if self.cursor_query_param not in request.query_params:
+            strategy = getattr(view, 'count_strategy', self.count_strategy)
+            self.django_paginator_class = partial(
+                CountPaginator,
+                count=self.count_strategies[strategy](queryset),
+            )
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_keyset_filter(queryset.model, cursor)
+            )
+
+        page = list(queryset[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
+    def get_paginated_response(self, data):
+        if self.ordering is None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_cursor_link(),
+            'previous': None,
+            'results': data,
+        })
+
+    def get_next_cursor_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.next_cursor,
+        )
+
+    def encode_cursor(self, obj):
+        # value_to_string сохраняет микросекунды, в отличие от JSON
+        values = [
+            obj._meta.get_field(name.lstrip('-')).value_to_string(obj)
+            for name in self.ordering
+        ]
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def get_keyset_filter(self, model, cursor):
+        """
+        Условие для записей после курсора, для порядка (a, b):
+        a < va OR (a = va AND b < vb), знак зависит от направления
+        """
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            values = [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.ordering, values)
+            ]
+        except (BinasciiError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+        keyset_filter = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            keyset_filter |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return keyset_filter
+
+
+class SearchLimitPagination(BasePagination):
+    """
+    Ограничивает выдачу поиска без подсчета общего количества.
+    Без поискового запроса список отдается целиком
+    """
+    max_results = settings.INGREDIENTS_SEARCH_LIMIT
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not request.query_params.get(UrlParams.NAME.value):
+            return None
+        return list(queryset[:self.max_results])
+
+    def get_paginated_response(self, data):
+        return Response(data)
@@ -0,0 +1,173 @@
+import re
+
+from core.metrics import serializer_timer
+from core.params import SUBSCRIBED
+from recipes.models import Recipes
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+
+from .fields import DETAIL, THUMBNAIL
+
+# Имена файлов, ссылка на которые не требует экранирования и urljoin
+SIMPLE_NAME = re.compile(r"[\w-][\w.-]*(?:/[\w-][\w.-]*)*", re.ASCII)
+
+
+def prefetched(instance, name):
+    """Предзагруженные связанные объекты без создания менеджера"""
+
+    cache = getattr(instance, "_prefetched_objects_cache", {})
+    if name in cache:
+        return cache[name]
+    return getattr(instance, name).all()
+
+
+class ReadSerializer:
+    """
+    Сериализатор только для чтения без полей DRF: словари ответа
+    строятся напрямую из предзагруженных объектов. Результат совпадает
+    с выдачей обычного сериализатора байт в байт, это проверяет команда
+    bench_serializers. Поддерживает instance, many, context и data
+    """
+
+    def __init__(self, instance=None, many=False, context=None, **kwargs):
+        self.instance = instance
+        self.many = many
+        self.context = context or {}
+        self.storage = Recipes._meta.get_field("image").storage
+        self.request = self.context.get("request")
+        self.media_url = getattr(self.storage, "base_url", None)
+        if self.media_url and self.request is not None:
+            self.media_url = self.request.build_absolute_uri(self.media_url)
+
+    @property
+    def data(self):
+        if not hasattr(self, "_data"):
+            with serializer_timer():
+                if self.many:
+                    self._data = ReturnList(
+                        map(self.to_representation, self.instance),
+                        serializer=self,
+                    )
+                else:
+                    self._data = ReturnDict(
+                        self.to_representation(self.instance),
+                        serializer=self,
+                    )
+        return self._data
+
+    def to_representation(self, instance):
+        raise NotImplementedError
+
+    def get_image(self, recipe, variant):
+        """Ссылка на вариант картинки, как у RecipeImageField"""
+
+        name = getattr(recipe, f"image_{variant}").name or recipe.image.name
+        if not name:
+            return None
+        if (
+            self.media_url
+            and self.media_url.endswith("/")
+            and SIMPLE_NAME.fullmatch(name)
+        ):
+            return self.media_url + name
+        url = self.storage.url(name)
+        if self.request is not None:
+            return self.request.build_absolute_uri(url)
+        return url
+
+    def get_user(self, user):
+        """Пользователь, как у UserSerializer"""
+
+        current_user = self.request.user
+        return {
+            "id": user.id,
+            "username": user.username,
+            "first_name": user.first_name,
+            "last_name": user.last_name,
+            "email": user.email,
+            "is_subscribed": (
+                current_user.is_authenticated
+                and current_user != user
+                and SUBSCRIBED in self.context
+                and user.id in self.context[SUBSCRIBED]
+            ),
+        }
+
+
+class RecipeReadSerializer(ReadSerializer):
+    """
+    Выдача RecipeSerializer для списка и страницы рецепта. Автор, теги
+    и ингридиенты должны быть загружены заранее (get_queryset)
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        view = self.context.get("view")
+        self.variant = (
+            THUMBNAIL if getattr(view, "action", None) == "list" else DETAIL
+        )
+
+    def to_representation(self, recipe):
+        return {
+            "id": recipe.id,
+            "tags": [
+                {
+                    "id": tag.id,
+                    "name": tag.name,
+                    "color": tag.color,
+                    "slug": tag.slug,
+                }
+                for tag in prefetched(recipe, "tags")
+            ],
+            "author": self.get_user(recipe.author),
+            "ingredients": [
+                {
+                    "id": ingredient.id,
+                    "name": ingredient.name,
+                    "measurement_unit": ingredient.measurement_unit,
+                    "amount": amount,
+                }
+                for ingredient, amount in self.get_ingredients(recipe)
+            ],
+            "name": recipe.name,
+            "image": self.get_image(recipe, self.variant),
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+            "is_favorited": getattr(recipe, "is_favorited", False),
+            "is_in_shopping_cart": getattr(
+                recipe, "is_in_shopping_cart", False
+            ),
+        }
+
+    @staticmethod
+    def get_ingredients(recipe):
+        return [
+            (item.ingredient, item.amount)
+            for item in prefetched(recipe, "recipe_ingredients")
+        ]
+
+
+class SubscriptionReadSerializer(ReadSerializer):
+    """
+    Выдача SubscriptionSerializer для списка подписок, рецепты авторов
+    должны быть загружены заранее
+    """
+
+    def to_representation(self, author):
+        return {
+            "id": author.id,
+            "username": author.username,
+            "email": author.email,
+            "first_name": author.first_name,
+            "last_name": author.last_name,
+            "is_subscribed": True,
+            "recipes": [
+                {
+                    "id": recipe.id,
+                    "name": recipe.name,
+                    "image": self.get_image(recipe, THUMBNAIL),
+                    "cooking_time": recipe.cooking_time,
+                }
+                for recipe in prefetched(author, "recipes")
+            ],
+            "recipes_count": int(author.recipes_count),
+        }
@@ -0,0 +1,60 @@
+import csv
+
+from rest_framework.renderers import BaseRenderer
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListTextRenderer(BaseRenderer):
+    """Рендерер списка покупок в текстовый файл"""
+
+    media_type = "text/plain"
+    format = "txt"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """Отображает служебные ответы (ошибки) построчно"""
+
+        if data is None:
+            return b""
+        if isinstance(data, dict):
+            data = "\n".join(f"{key}: {value}" for key, value in data.items())
+        return str(data).encode(self.charset)
+
+    def stream(self, username, ingredients):
+        """Построчно формирует файл списка покупок"""
+
+        yield f"Покупки пользователя {username}:\n\n"
+        for ingredient in ingredients:
+            yield (
+                f'{ingredient["name"]} {ingredient["amount"]}'
+                f' - ({ingredient["measurement"]}); \n'
+            )
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    """Рендерер списка покупок в CSV файл"""
+
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, username, ingredients):
+        """Построчно формирует CSV файл списка покупок"""
+
+        writer = csv.writer(_Echo())
+        yield writer.writerow(
+            ("Ингридиент", "Количество", "Единица измерения")
+        )
+        for ingredient in ingredients:
+            yield writer.writerow(
+                (
+                    ingredient["name"],
+                    ingredient["amount"],
+                    ingredient["measurement"],
+                )
+            )
@@ -1,15 +1,31 @@
-from pathlib import Path
-
 from core import validators
+from core.images import schedule_image_processing, schedule_images_deletion
+from core.metrics import MeasuredSerializerMixin
+from core.params import RECIPE_VERSION
+from django.conf import settings
 from django.db import transaction
-from django.db.models import F
-from drf_extra_fields.fields import Base64ImageField
+from django.db.models import Prefetch, prefetch_related_objects
 from recipes.models import Ingredient, RecipeIngregient, Recipes, Tags
 from rest_framework import serializers
 from users.serializers import UserSerializer
 
+from .cache import recipe_list_cache
+from .fields import THUMBNAIL, RecipeImageField
+from .models import TableVersion
+
+
+def recipe_ingredients_prefetch():
+    """Предзагрузка ингридиентов рецепта в порядке их названия"""
+
+    return Prefetch(
+        "recipe_ingredients",
+        queryset=RecipeIngregient.objects.select_related(
+            "ingredient"
+        ).order_by("ingredient__name"),
+    )
+
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для тегов"""
 
     class Meta:
@@ -17,7 +33,9 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(
+    MeasuredSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор для ингридиента"""
 
     class Meta:
@@ -25,20 +43,48 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class RecipeShortSerializer(serializers.ModelSerializer):
+class BulkRelationsSerializer(serializers.Serializer):
+    """Списки id для пакетного добавления и удаления связей"""
+
+    add = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BULK_RELATIONS_LIMIT,
+    )
+    remove = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        default=list,
+        max_length=settings.BULK_RELATIONS_LIMIT,
+    )
+
+    def validate(self, attrs):
+        add = list(dict.fromkeys(attrs["add"]))
+        remove = list(dict.fromkeys(attrs["remove"]))
+        if set(add) & set(remove):
+            raise serializers.ValidationError(
+                "Один и тот же id нельзя добавить и удалить"
+            )
+        return {"add": add, "remove": remove}
+
+
+class RecipeShortSerializer(
+    MeasuredSerializerMixin, serializers.ModelSerializer
+):
     """Сериализатор для краткого отображения рецепта"""
 
+    image = RecipeImageField(variant=THUMBNAIL, read_only=True)
+
     class Meta:
         model = Recipes
         fields = ("id", "name", "image", "cooking_time")
         read_only_fields = ("__all__",)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для рецептов"""
 
     author = UserSerializer(read_only=True)
-    image = Base64ImageField()
+    image = RecipeImageField()
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     is_favorited = serializers.SerializerMethodField()
@@ -66,37 +112,63 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         recipe = Recipes.objects.create(**validated_data)
+        schedule_image_processing(recipe)
 
         recipe.tags.set(tags)
         self.create_ingridients(recipe, ingredients)
+        prefetch_related_objects([recipe], recipe_ingredients_prefetch())
 
         return recipe
 
     @transaction.atomic()
     def update(self, instance, validated_data):
         """
-        Обновляет рецепт с ингридиентами, тегами и картинкой в базе данных
+        Обновляет рецепт с ингридиентами, тегами и картинкой в базе данных.
+        Изменяются только те строки, которые действительно поменялись,
+        их количество сохраняется в атрибуте rows_affected
         """
-        if "image" in validated_data:
-            # Удаляем старую картинку
-            image = Path(instance.image.path)
-            image.unlink()
+        image_changed = "image" in validated_data
+        if image_changed:
+            # Старые файлы удаляются, новые варианты строятся в фоне
+            schedule_images_deletion(
+                instance.image, instance.image_thumbnail, instance.image_detail
+            )
+            validated_data["image_thumbnail"] = ""
+            validated_data["image_detail"] = ""
 
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
 
-        for key, value in validated_data.items():
-            if hasattr(instance, key):
-                setattr(instance, key, value)
-
-        if ingredients:
-            instance.ingredients.clear()
-            self.create_ingridients(instance, ingredients)
-        if tags:
-            instance.tags.clear()
-            instance.tags.set(tags)
-
-        instance.save()
+        changed_fields = [
+            key
+            for key, value in validated_data.items()
+            if hasattr(instance, key) and getattr(instance, key) != value
+        ]
+        for key in changed_fields:
+            setattr(instance, key, validated_data[key])
+
+        tag_ids = {tag.id for tag in instance.tags.all()}
+        self.rows_affected = self.update_ingredients(instance, ingredients)
+        tags_affected = self.update_tags(instance, tags)
+        self.rows_affected += tags_affected
+
+        if changed_fields:
+            instance.save(update_fields=changed_fields)
+            self.rows_affected += 1
+        if image_changed:
+            schedule_image_processing(instance)
+        if self.rows_affected and not changed_fields:
+            # bulk операции не отправляют сигналы, а save не вызывался
+            TableVersion.bump(RECIPE_VERSION.format(instance.pk))
+        if tags_affected or (self.rows_affected and not changed_fields):
+            # Страницы прежних и новых тегов, save сбрасывает только новые
+            tag_ids.update(int(tag) for tag in tags)
+            recipe_list_cache.invalidate(
+                tags=Tags.objects.filter(pk__in=tag_ids).values_list(
+                    "slug", flat=True
+                ),
+                authors=(instance.author_id,),
+            )
         return instance
 
     def validate(self, data):
@@ -116,6 +188,8 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Необходимо указать ингридиенты")
 
         validators.inrg_exist(ingredients)
+        ingredients = self.merge_ingredients(ingredients)
+        validators.ingredients_exist(ingredients)
         data.update(
             {
                 "tags": tags,
@@ -128,32 +202,109 @@ class RecipeSerializer(serializers.ModelSerializer):
     def get_ingredients(self, recipes):
         """Формирует список ингридиентов для рецепта"""
 
-        return recipes.ingredients.values(
-            "id",
-            "name",
-            "measurement_unit",
-            amount=F("recipeingregient__amount"),
-        )
+        if "recipe_ingredients" not in getattr(
+            recipes, "_prefetched_objects_cache", {}
+        ):
+            # После обновления DRF сбрасывает предзагруженные данные
+            prefetch_related_objects([recipes], recipe_ingredients_prefetch())
+        return [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipes.recipe_ingredients.all()
+        ]
 
     def get_is_favorited(self, obj):
         """Проверяет, добавлен ли рецепт в избранное"""
-        user = self.context["request"].user
-        return (
-            user.is_authenticated and obj.id in self.context["subscriptions"]
-        )
+        return getattr(obj, "is_favorited", False)
 
     def get_is_in_shopping_cart(self, obj):
         """Проверяет, добавлен ли рецепт в список покупок"""
-        user = self.context["request"].user
-        return (
-            user.is_authenticated and obj.id in self.context["shopping_list"]
-        )
+        return getattr(obj, "is_in_shopping_cart", False)
 
-    def create_ingridients(self, recipe, ingredients):
-        """Заполняет таблицу ингридиентов для рецепта"""
+    @staticmethod
+    def merge_ingredients(ingredients):
+        """
+        Объединяет повторяющиеся ингридиенты, суммируя их количество.
+        Возвращает словарь {id ингридиента: количество}
+        """
+
+        merged = {}
         for ingredient in ingredients:
-            RecipeIngregient.objects.get_or_create(
-                recipe=recipe,
-                ingredient=Ingredient.objects.get(pk=ingredient["id"]),
-                amount=ingredient["amount"],
+            pk = int(ingredient["id"])
+            merged[pk] = merged.get(pk, 0) + int(ingredient["amount"])
+        return merged
+
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Приводит ингридиенты рецепта к переданным: добавляет новые,
+        меняет количество у изменившихся и удаляет лишние.
+        Возвращает количество затронутых строк
+        """
+
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+
+        to_delete = current.keys() - ingredients.keys()
+        to_create = {
+            pk: amount
+            for pk, amount in ingredients.items()
+            if pk not in current
+        }
+        to_update = []
+        for pk, amount in ingredients.items():
+            if pk in current and current[pk].amount != amount:
+                current[pk].amount = amount
+                to_update.append(current[pk])
+
+        if to_delete:
+            # Обычное удаление: сигналы post_delete обновляют версию
+            # рецепта и кэш списка по каждой удалённой строке
+            RecipeIngregient.objects.filter(
+                recipe=recipe, ingredient_id__in=to_delete
+            ).delete()
+        if to_create:
+            self.create_ingridients(recipe, to_create)
+        if to_update:
+            RecipeIngregient.objects.bulk_update(to_update, ("amount",))
+
+        return len(to_delete) + len(to_create) + len(to_update)
+
+    def update_tags(self, recipe, tags):
+        """
+        Приводит теги рецепта к переданным, не трогая неизменившиеся.
+        Строки связи меняются пакетно без сигналов m2m_changed.
+        Возвращает количество затронутых строк
+        """
+
+        current = {tag.id for tag in recipe.tags.all()}
+        tags = {int(tag) for tag in tags}
+
+        to_remove = current - tags
+        to_add = tags - current
+        through = Recipes.tags.through
+        if to_remove:
+            through.objects.filter(
+                recipes=recipe, tags_id__in=to_remove
+            ).delete()
+        if to_add:
+            through.objects.bulk_create(
+                through(recipes=recipe, tags_id=pk) for pk in to_add
             )
+        if to_remove or to_add:
+            # Кэш recipe.tags.all() устарел
+            getattr(recipe, "_prefetched_objects_cache", {}).pop("tags", None)
+
+        return len(to_remove) + len(to_add)
+
+    def create_ingridients(self, recipe, ingredients):
+        """Заполняет таблицу ингридиентов для рецепта одним запросом"""
+        RecipeIngregient.objects.bulk_create(
+            RecipeIngregient(recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in ingredients.items()
+        )
@@ -0,0 +1,1185 @@
+import io
+import json
+import os
+import tempfile
+from base64 import b64encode, urlsafe_b64encode
+from unittest import mock
+
+from core.db.postgresql.base import ConnectionPool, DatabaseWrapper, _pools
+from core.ingredients_index import ingredients_index
+from core.testing import FoodgramAPITestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from psycopg2 import Error as DatabaseError
+from psycopg2 import extensions
+from recipes.models import (Follow, Ingredient, Recipes, SelectedRecipes,
+                            ShoppingList, Tags)
+from users.models import User
+
+from .cache import recipe_list_cache
+from .models import StoredFile
+from .paginators import cached_count, estimated_count
+from .views import CreateRecipeView
+
+IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA"
+    "DUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+)
+
+
+@override_settings(RECIPES_LIST_CACHE_TTL=0)
+class RecipeQueriesTest(FoodgramAPITestCase):
+    """Количество запросов к базе не зависит от размера страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = cls.create_users(1)
+        tags = cls.create_tags()
+        ingredients = cls.create_ingredients()
+        cls.recipes = [
+            cls.create_recipe(
+                cls.user,
+                tags=tags[:i % 3 + 1],
+                ingredients=ingredients[:i % 5 + 1],
+                name=f"Рецепт {i}",
+            )
+            for i in range(10)
+        ]
+
+    def assert_list_queries(self, num):
+        for limit in (2, 8):
+            with self.subTest(limit=limit), self.assertNumQueries(num):
+                response = self.client.get(
+                    "/api/recipes/", {"limit": limit}
+                )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), limit)
+
+    def assert_retrieve_queries(self, num):
+        # Рецепты с одним и с пятью ингредиентами
+        for recipe in (self.recipes[0], self.recipes[4]):
+            with self.subTest(recipe=recipe.pk), self.assertNumQueries(num):
+                response = self.client.get(f"/api/recipes/{recipe.pk}/")
+            self.assertEqual(response.status_code, 200)
+
+    def test_list_anonymous(self):
+        self.assert_list_queries(4)
+
+    def test_list_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_list_queries(4)
+
+    def test_retrieve_anonymous(self):
+        self.assert_retrieve_queries(4)
+
+    def test_retrieve_authenticated(self):
+        self.client.force_authenticate(self.user)
+        self.assert_retrieve_queries(4)
+
+
+@override_settings(FAST_READ_SERIALIZERS=False)
+class RecipeSerializerQueriesTest(RecipeQueriesTest):
+    """То же для RecipeSerializer без быстрого сериализатора чтения"""
+
+
+class RecipeConditionalGetTest(FoodgramAPITestCase):
+    """ETag рецепта зависит только от его данных и признаков пользователя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = cls.create_users(2)
+        cls.recipe = cls.create_recipe(cls.user)
+        cls.second = cls.create_recipe(cls.user, name="Второй рецепт")
+        cls.url = f"/api/recipes/{cls.recipe.pk}/"
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def assert_status(self, status_code, url=None):
+        response = self.client.get(
+            url or self.url, HTTP_IF_NONE_MATCH=self.etag
+        )
+        self.assertEqual(response.status_code, status_code)
+
+    def test_not_modified(self):
+        self.assert_status(304)
+
+    def test_other_user_favorite(self):
+        self.client.force_authenticate(self.other)
+        self.client.post(f"/api/recipes/{self.recipe.pk}/favorite/")
+        self.client.force_authenticate(self.user)
+        self.assert_status(304)
+
+    def test_own_favorite(self):
+        self.client.post(f"/api/recipes/{self.second.pk}/favorite/")
+        self.assert_status(200)
+
+    def test_other_recipe_changed(self):
+        self.second.name = "Новое название"
+        self.second.save()
+        self.assert_status(304)
+
+    def test_recipe_changed(self):
+        self.recipe.name = "Новое название"
+        self.recipe.save()
+        self.assert_status(200)
+
+    def test_recipe_deleted(self):
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, 204)
+        self.assert_status(404)
+
+    def test_author_deleted(self):
+        # Копия: delete обнуляет pk, а он входит в ETag
+        User.objects.get(pk=self.user.pk).delete()
+        self.assert_status(404)
+
+    def test_query_string_and_format(self):
+        self.assert_status(200, f"{self.url}?format=json")
+        self.assert_status(200, f"{self.url}?format=api")
+
+
+class RecipeDeleteTest(FoodgramAPITestCase):
+    """Каскадное удаление не обновляет счетчики по одной строке"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, *cls.users = cls.create_users(6)
+
+    def create_fans_recipe(self, fans):
+        recipe = self.create_recipe(self.author)
+        for user in fans:
+            SelectedRecipes.objects.create(user=user, recipe=recipe)
+            ShoppingList.objects.create(user=user, recipe=recipe)
+        return recipe
+
+    def test_recipe_delete_queries(self):
+        self.client.force_authenticate(self.author)
+        for fans in (self.users[:1], self.users):
+            recipe = self.create_fans_recipe(fans)
+            with self.subTest(fans=len(fans)), self.assertNumQueries(12):
+                response = self.client.delete(f"/api/recipes/{recipe.pk}/")
+            self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 0)
+
+    def test_user_delete_counters(self):
+        recipe = self.create_fans_recipe(self.users[:3])
+        self.users[0].delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 2)
+        self.assertEqual(recipe.cart_count, 2)
+
+
+@override_settings(
+    RECIPES_LIST_CACHE_TTL=0, MEDIA_ROOT=tempfile.mkdtemp()
+)
+class RecipeQueryBudgetTest(FoodgramAPITestCase):
+    """Маршруты api укладываются в бюджеты запросов представлений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = cls.create_users(2)
+        cls.tags = cls.create_tags()
+        cls.ingredients = cls.create_ingredients()
+        cls.recipes = [
+            cls.create_recipe(
+                (cls.user, cls.other)[i % 2],
+                tags=cls.tags[:i % 3 + 1],
+                ingredients=cls.ingredients[:i % 5 + 1],
+                amount=i + 1,
+                name=f"Рецепт {i}",
+            )
+            for i in range(8)
+        ]
+        for recipe in cls.recipes[:4]:
+            SelectedRecipes.objects.create(user=cls.user, recipe=recipe)
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.authenticate(self.user)
+
+    def recipe_data(self, **kwargs):
+        return {
+            "name": "Новый рецепт",
+            "text": "Описание",
+            "cooking_time": 5,
+            "image": IMAGE,
+            "tags": [tag.id for tag in self.tags[:2]],
+            "ingredients": [
+                {"id": ingredient.id, "amount": 2}
+                for ingredient in self.ingredients[:3]
+            ],
+            **kwargs,
+        }
+
+    def test_read_routes(self):
+        recipe = self.recipes[0]
+        for path in (
+            "/api/tags/",
+            f"/api/tags/{self.tags[0].pk}/",
+            "/api/ingredients/",
+            "/api/ingredients/?name=ингр",
+            f"/api/ingredients/{self.ingredients[0].pk}/",
+            "/api/recipes/",
+            "/api/recipes/?limit=3&page=2",
+            "/api/recipes/?tags=tag0&tags=tag1",
+            "/api/recipes/?tags=tag0&tags=tag1&tags_mode=all",
+            f"/api/recipes/?author={self.other.pk}",
+            "/api/recipes/?is_favorited=1",
+            "/api/recipes/?is_in_shopping_cart=1",
+            "/api/recipes/?cursor=",
+            f"/api/recipes/{recipe.pk}/",
+            "/api/recipes/download_shopping_cart/",
+            "/api/recipes/download_shopping_cart/?format=csv",
+        ):
+            with self.subTest(path=path):
+                self.assert_budget("GET", path)
+
+    def test_read_routes_anonymous(self):
+        self.authenticate(None)
+        for path in (
+            "/api/tags/",
+            "/api/ingredients/",
+            "/api/recipes/",
+            f"/api/recipes/{self.recipes[0].pk}/",
+        ):
+            with self.subTest(path=path):
+                self.assert_budget("GET", path)
+
+    def test_write_routes(self):
+        response = self.assert_budget(
+            "POST",
+            "/api/recipes/",
+            status_code=201,
+            data=self.recipe_data(),
+            format="json",
+        )
+        path = f"/api/recipes/{response.data['id']}/"
+        self.assert_budget(
+            "PATCH",
+            path,
+            data={
+                "name": "Другое название",
+                "tags": [tag.id for tag in self.tags[1:]],
+                "ingredients": self.recipe_data()["ingredients"][1:],
+            },
+            format="json",
+        )
+        self.assert_budget(
+            "PUT", path, data=self.recipe_data(), format="json"
+        )
+        self.assert_budget("DELETE", path, status_code=204)
+
+    def test_relation_routes(self):
+        recipe = self.recipes[6]
+        for relation in ("favorite", "shopping_cart"):
+            path = f"/api/recipes/{recipe.pk}/{relation}/"
+            with self.subTest(relation=relation):
+                self.assert_budget("POST", path, status_code=201)
+                self.assert_budget("DELETE", path, status_code=204)
+                self.assert_budget(
+                    "POST",
+                    f"/api/recipes/{relation}/bulk/",
+                    data={
+                        "add": [item.pk for item in self.recipes[4:]],
+                        "remove": [item.pk for item in self.recipes[:2]],
+                    },
+                    format="json",
+                )
+
+
+@override_settings(RECIPES_LIST_CACHE_TTL=0)
+class ReadSerializerParityTest(FoodgramAPITestCase):
+    """
+    Быстрые сериализаторы чтения (FAST_READ_SERIALIZERS) отдают те же
+    байты, что и сериализаторы DRF
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *authors = cls.create_users(4)
+        tags = cls.create_tags()
+        ingredients = cls.create_ingredients()
+        cls.recipes = [
+            cls.create_recipe(
+                (cls.user, *authors)[i % 4],
+                tags=tags[i % 3:],
+                ingredients=ingredients[:i % 5 + 1],
+                amount=i + 1,
+                name=f"Рецепт {i}",
+                image=f"recipes/images/recipe {i}.png",
+                # Варианты картинки есть не у всех рецептов
+                image_thumbnail=(
+                    f"recipes/images/recipe{i}_thumb.jpg" if i % 3 else ""
+                ),
+                image_detail=(
+                    f"recipes/images/recipe{i}_detail.jpg" if i % 2 else ""
+                ),
+                text=f"Описание {i}",
+                cooking_time=i + 1,
+            )
+            for i in range(12)
+        ]
+        for recipe in cls.recipes[::3]:
+            SelectedRecipes.objects.create(user=cls.user, recipe=recipe)
+        for recipe in cls.recipes[1::4]:
+            ShoppingList.objects.create(user=cls.user, recipe=recipe)
+        for author in authors[:2]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def get(self, path, fast):
+        with override_settings(FAST_READ_SERIALIZERS=fast):
+            response = self.client.get(path)
+        return response.status_code, response.content
+
+    def assert_parity(self, paths):
+        for path in paths:
+            with self.subTest(path=path):
+                fast = self.get(path, fast=True)
+                self.assertEqual(fast[0], 200)
+                self.assertEqual(fast, self.get(path, fast=False))
+
+    def recipe_paths(self):
+        return [
+            "/api/recipes/",
+            "/api/recipes/?limit=5&page=2",
+            "/api/recipes/?tags=tag0&tags=tag2",
+            f"/api/recipes/?author={self.user.pk}",
+            *(f"/api/recipes/{recipe.pk}/" for recipe in self.recipes[:6]),
+        ]
+
+    def test_recipes_anonymous(self):
+        self.assert_parity(self.recipe_paths())
+
+    def test_recipes_authenticated(self):
+        self.authenticate(self.user)
+        self.assert_parity(
+            [
+                *self.recipe_paths(),
+                "/api/recipes/?is_favorited=1",
+                "/api/recipes/?is_in_shopping_cart=1",
+            ]
+        )
+
+    def test_subscriptions(self):
+        self.authenticate(self.user)
+        self.assert_parity(
+            [
+                "/api/users/subscriptions/",
+                "/api/users/subscriptions/?recipes_limit=1",
+                "/api/users/subscriptions/?limit=1&page=2",
+            ]
+        )
+
+
+class CountStrategyTest(FoodgramAPITestCase):
+    """Способы подсчета количества записей для пагинации"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = cls.create_users(1)
+        cls.recipes = [
+            cls.create_recipe(
+                cls.user, name=f"Рецепт {i}", cooking_time=i + 1
+            )
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_count(self):
+        queryset = Recipes.objects.filter(cooking_time__gt=2)
+        with self.assertNumQueries(1):
+            self.assertEqual(cached_count(queryset), 3)
+        self.create_recipe(self.user, name="Новый рецепт", cooking_time=10)
+        # До истечения COUNT_CACHE_TTL отдается сохраненное значение
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_count(queryset), 3)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                cached_count(Recipes.objects.filter(cooking_time__gt=3)), 3
+            )
+
+    def test_cached_count_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_count(Recipes.objects.none()), 0)
+            self.assertEqual(
+                cached_count(Recipes.objects.filter(pk__in=[])), 0
+            )
+
+    def test_cached_count_empty_filter(self):
+        # Фильтр избранного отдает none() анонимному пользователю
+        with mock.patch.object(CreateRecipeView, "count_strategy", "cached"):
+            response = self.client.get("/api/recipes/?is_favorited=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 0)
+
+    def test_estimated_count_exact(self):
+        # Не Postgres: всегда точное количество
+        self.assertEqual(estimated_count(Recipes.objects.all()), 5)
+        self.assertEqual(estimated_count(Recipes.objects.none()), 0)
+
+    def mock_postgres(self, reltuples):
+        connection = mock.MagicMock(vendor="postgresql")
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (reltuples,)
+        patcher = mock.patch(
+            "api.paginators.connections", {"default": connection}
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cursor
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=100)
+    def test_estimated_count_postgres(self):
+        cursor = self.mock_postgres(50000)
+        self.assertEqual(estimated_count(Recipes.objects.all()), 50000)
+        cursor.execute.assert_called_once()
+
+    @override_settings(COUNT_ESTIMATE_THRESHOLD=100)
+    def test_estimated_count_postgres_fallback(self):
+        cursor = self.mock_postgres(-1)
+        # До ANALYZE статистики нет
+        self.assertEqual(estimated_count(Recipes.objects.all()), 5)
+        cursor.reset_mock()
+        for queryset, count in (
+            (Recipes.objects.filter(cooking_time__gt=2), 3),
+            (Recipes.objects.none(), 0),
+            (Recipes.objects.filter(pk__in=[]), 0),
+        ):
+            with self.subTest(query=str(queryset.query.where)):
+                self.assertEqual(estimated_count(queryset), count)
+        cursor.execute.assert_not_called()
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Пул соединений core.db.postgresql без сервера базы данных"""
+
+    def setUp(self):
+        self.connect = mock.Mock(side_effect=self.new_connection)
+
+    @staticmethod
+    def new_connection():
+        connection = mock.MagicMock(closed=0, isolation_level=1)
+        connection.info.transaction_status = (
+            extensions.TRANSACTION_STATUS_IDLE
+        )
+        return connection
+
+    def create_pool(self, max_size=2, idle_size=2, timeout=0.01):
+        return ConnectionPool(self.connect, max_size, idle_size, timeout)
+
+    def test_checkout_and_return(self):
+        pool = self.create_pool()
+        connection, reused = pool.get()
+        self.assertFalse(reused)
+        pool.put(connection)
+        self.assertEqual(pool.get(), (connection, True))
+        self.assertEqual(self.connect.call_count, 1)
+        connection.close.assert_not_called()
+
+    def test_exhausted(self):
+        pool = self.create_pool(max_size=1)
+        connection, _ = pool.get()
+        with self.assertRaises(OperationalError):
+            pool.get()
+        pool.put(connection)
+        self.assertEqual(pool.get(), (connection, True))
+
+    def test_connect_error_releases_slot(self):
+        pool = self.create_pool(max_size=1)
+        self.connect.side_effect = [DatabaseError, self.new_connection()]
+        with self.assertRaises(DatabaseError):
+            pool.get()
+        self.assertFalse(pool.get()[1])
+
+    def test_broken_connections_discarded(self):
+        pool = self.create_pool(max_size=1)
+        closed = self.new_connection()
+        closed.closed = 1
+        in_transaction = self.new_connection()
+        in_transaction.info.transaction_status = (
+            extensions.TRANSACTION_STATUS_INERROR
+        )
+        discarded = self.new_connection()
+        for connection, discard in (
+            (closed, False),
+            (in_transaction, False),
+            (discarded, True),
+        ):
+            self.connect.side_effect = [connection]
+            self.assertEqual(pool.get(), (connection, False))
+            pool.put(connection, discard=discard)
+            connection.close.assert_called_once()
+
+    def test_idle_trimmed(self):
+        pool = self.create_pool(max_size=3, idle_size=1)
+        connections = [pool.get()[0] for _ in range(3)]
+        for connection in connections:
+            pool.put(connection)
+        self.assertEqual(
+            [connection.close.called for connection in connections],
+            [False, True, True],
+        )
+        self.assertEqual(pool.get(), (connections[0], True))
+        self.assertFalse(pool.get()[1])
+
+    def test_health_check(self):
+        wrapper = DatabaseWrapper(
+            {
+                "CONN_MAX_AGE": 0,
+                "CONN_HEALTH_CHECKS": True,
+                "POOL": {"MAX_SIZE": 2, "IDLE_SIZE": 2, "TIMEOUT": 0.01},
+                "OPTIONS": {},
+            },
+            alias="pool_test",
+        )
+        pool = _pools["pool_test"] = self.create_pool()
+        self.addCleanup(_pools.pop, "pool_test")
+        broken, _ = pool.get()
+        cursor = broken.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = DatabaseError
+        pool.put(broken)
+
+        connection = wrapper.get_new_connection({})
+        self.assertIsNot(connection, broken)
+        broken.close.assert_called_once()
+        self.assertEqual(self.connect.call_count, 2)
+
+    def test_max_age_with_pool(self):
+        with self.assertRaises(ImproperlyConfigured):
+            DatabaseWrapper(
+                {"CONN_MAX_AGE": 60, "POOL": {"MAX_SIZE": 1}},
+                alias="pool_test",
+            )
+
+
+@override_settings(
+    RECIPES_LIST_CACHE_TTL=600,
+    BACKGROUND_TASKS_EAGER=True,
+    MEDIA_ROOT=tempfile.mkdtemp(),
+)
+class RecipeListCacheTest(FoodgramAPITestCase):
+    """
+    Кэш страниц списка рецептов: смена поколений после изменения
+    рецептов, тегов, ингридиентов и авторов
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other = cls.create_users(2)
+        cls.tags = cls.create_tags()
+        cls.ingredients = cls.create_ingredients(2)
+        cls.recipe = cls.create_recipe(
+            cls.user, tags=cls.tags[:2], ingredients=cls.ingredients
+        )
+        cls.create_recipe(
+            cls.other,
+            tags=cls.tags[2:],
+            ingredients=cls.ingredients[:1],
+            name="Чужой рецепт",
+        )
+        cls.all = "/api/recipes/"
+        cls.author = f"/api/recipes/?author={cls.user.pk}"
+        cls.other_author = f"/api/recipes/?author={cls.other.pk}"
+        cls.tag_paths = [f"/api/recipes/?tags={tag.slug}" for tag in cls.tags]
+
+    def setUp(self):
+        recipe_list_cache.cache.clear()
+
+    def get(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assert_cached(self, paths, hit):
+        for path in paths:
+            with self.subTest(path=path, hit=hit):
+                self.assertEqual(
+                    self.get(path)["X-Cache"], "HIT" if hit else "MISS"
+                )
+
+    def change(self, *paths):
+        """
+        Кэширует страницы paths и выполняет изменение в контексте,
+        поколения меняются после фиксации транзакции
+        """
+        for path in paths:
+            self.get(path)
+        return self.captureOnCommitCallbacks(execute=True)
+
+    def test_miss_then_hit(self):
+        response = self.get(self.all)
+        self.assertEqual(response["X-Cache"], "MISS")
+        cached = self.get(self.all)
+        self.assertEqual(cached["X-Cache"], "HIT")
+        self.assertEqual(cached.data, response.data)
+        self.assertEqual(
+            recipe_list_cache.stats(), {"hits": 1, "misses": 1}
+        )
+
+    def test_authenticated_not_cached(self):
+        self.authenticate(self.user)
+        self.get(self.all)
+        self.assertNotIn("X-Cache", self.get(self.all))
+
+    def test_recipe_update(self):
+        with self.change(self.all, self.author, self.other_author):
+            self.authenticate(self.user)
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.pk}/",
+                {
+                    "name": "Новое название",
+                    "tags": [tag.id for tag in self.tags[:2]],
+                    "ingredients": [
+                        {"id": ingredient.id, "amount": 1}
+                        for ingredient in self.ingredients
+                    ],
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.authenticate(None)
+        self.assert_cached((self.all, self.author), hit=False)
+        self.assert_cached((self.other_author,), hit=True)
+        self.assertEqual(
+            self.get(self.author).data["results"][0]["name"],
+            "Новое название",
+        )
+
+    def test_recipe_tags_change(self):
+        with self.change(*self.tag_paths):
+            self.authenticate(self.user)
+            response = self.client.patch(
+                f"/api/recipes/{self.recipe.pk}/",
+                {
+                    "tags": [self.tags[1].id],
+                    "ingredients": [
+                        {"id": ingredient.id, "amount": 1}
+                        for ingredient in self.ingredients
+                    ],
+                },
+                format="json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.authenticate(None)
+        # Страницы убранного и оставшегося тегов сброшены, чужого - нет
+        self.assert_cached(self.tag_paths[:2], hit=False)
+        self.assert_cached(self.tag_paths[2:], hit=True)
+        self.assertEqual(self.get(self.tag_paths[0]).data["count"], 0)
+
+    def test_recipe_delete(self):
+        with self.change(self.all, self.tag_paths[0], self.other_author):
+            self.authenticate(self.user)
+            response = self.client.delete(f"/api/recipes/{self.recipe.pk}/")
+        self.assertEqual(response.status_code, 204)
+        self.authenticate(None)
+        self.assert_cached((self.all, self.tag_paths[0]), hit=False)
+        self.assert_cached((self.other_author,), hit=True)
+        self.assertEqual(self.get(self.all).data["count"], 1)
+
+    def test_author_change(self):
+        with self.change(self.all, self.other_author):
+            self.user.first_name = "Новое имя"
+            self.user.save()
+        self.assert_cached((self.all, self.other_author), hit=False)
+        authors = [
+            recipe["author"]["first_name"]
+            for recipe in self.get(self.author).data["results"]
+        ]
+        self.assertEqual(authors, ["Новое имя"])
+
+    def test_login_keeps_cache(self):
+        with self.change(self.all):
+            self.user.save(update_fields=("last_login",))
+        self.assert_cached((self.all,), hit=True)
+
+    def test_ingredient_change(self):
+        with self.change(self.all, *self.tag_paths):
+            Ingredient.objects.filter(pk=self.ingredients[0].pk).get().save()
+        self.assert_cached((self.all, *self.tag_paths), hit=False)
+
+    def test_tag_change(self):
+        with self.change(self.all, self.other_author):
+            tag = Tags.objects.get(pk=self.tags[0].pk)
+            tag.name = "Новый тег"
+            tag.save()
+        self.assert_cached((self.all, self.other_author), hit=False)
+
+
+@override_settings(RECIPES_LIST_CACHE_TTL=0)
+class KeysetPaginationTest(FoodgramAPITestCase):
+    """Keyset пагинация списков с параметром cursor"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = cls.create_users(6)
+        tags = cls.create_tags(2)
+        cls.recipes = [
+            cls.create_recipe(
+                cls.authors[i % 5], tags=tags[i % 2:], name=f"Рецепт {i}"
+            )
+            for i in range(9)
+        ]
+        # Записи с одинаковой датой упорядочиваются по id
+        Recipes.objects.filter(
+            pk__in=[recipe.pk for recipe in cls.recipes[2:7]]
+        ).update(pub_date=timezone.now())
+        for author in cls.authors:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def follow(self, url):
+        """id записей всех страниц по ссылкам next"""
+
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data["previous"])
+            ids += [item["id"] for item in response.data["results"]]
+            url = response.data["next"]
+        return ids
+
+    def test_recipes(self):
+        expected = list(
+            Recipes.objects.order_by("-pub_date", "-id").values_list(
+                "pk", flat=True
+            )
+        )
+        for limit in (1, 2, 4, 9, 20):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.follow(f"/api/recipes/?cursor=&limit={limit}"),
+                    expected,
+                )
+
+    def test_recipes_filtered(self):
+        expected = list(
+            Recipes.objects.filter(tags__slug="tag1")
+            .order_by("-pub_date", "-id")
+            .values_list("pk", flat=True)
+        )
+        self.assertEqual(
+            self.follow("/api/recipes/?tags=tag1&cursor=&limit=2"), expected
+        )
+
+    def test_invalid_cursor(self):
+        def encode(values):
+            return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for cursor in (
+            "не base64",
+            "bm90IGpzb24",
+            encode(["2020-01-01T00:00:00"]),
+            encode(["не дата", 1]),
+            encode(["2020-01-01T00:00:00", "не число"]),
+            encode({"pub_date": 1}),
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    "/api/recipes/", {"cursor": cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_subscriptions(self):
+        self.authenticate(self.user)
+        ids = self.follow(
+            "/api/users/subscriptions/?cursor=&limit=2&recipes_limit=1"
+        )
+        self.assertEqual(ids, [author.pk for author in self.authors])
+        response = self.client.get(
+            "/api/users/subscriptions/?cursor=&limit=2&recipes_limit=1"
+        )
+        self.assertIn("recipes_limit=1", response.data["next"])
+        for author in response.data["results"]:
+            self.assertEqual(len(author["recipes"]), 1)
+
+
+class RelationsTest(FoodgramAPITestCase):
+    """Добавление и удаление избранного, списка покупок и подписок"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = cls.create_users(2)
+        cls.recipe = cls.create_recipe(cls.author)
+
+    def setUp(self):
+        self.authenticate(self.user)
+
+    def assert_counter(self, field, value):
+        self.recipe.refresh_from_db()
+        self.assertEqual(getattr(self.recipe, field), value)
+
+    def test_recipe_relations(self):
+        for relation, model, field in (
+            ("favorite", SelectedRecipes, "favorites_count"),
+            ("shopping_cart", ShoppingList, "cart_count"),
+        ):
+            url = f"/api/recipes/{self.recipe.pk}/{relation}/"
+            relations = model.objects.filter(
+                user=self.user, recipe=self.recipe
+            )
+            with self.subTest(relation=relation):
+                response = self.client.post(url)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(response.data["id"], self.recipe.pk)
+                self.assert_counter(field, 1)
+
+                # Повторное добавление не создает вторую запись
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(relations.count(), 1)
+                self.assert_counter(field, 1)
+
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertFalse(relations.exists())
+                self.assert_counter(field, 0)
+
+                # Удаление отсутствующей записи
+                self.assertEqual(self.client.delete(url).status_code, 400)
+                self.assert_counter(field, 0)
+
+    def test_missing_recipe(self):
+        for relation in ("favorite", "shopping_cart"):
+            with self.subTest(relation=relation):
+                response = self.client.post(f"/api/recipes/0/{relation}/")
+                self.assertEqual(response.status_code, 404)
+
+    def test_subscribe(self):
+        url = f"/api/users/{self.author.pk}/subscribe/"
+        follows = Follow.objects.filter(user=self.user, author=self.author)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data["is_subscribed"])
+        self.assertEqual(response.data["recipes_count"], 1)
+
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(follows.count(), 1)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertFalse(follows.exists())
+        self.assertEqual(self.client.delete(url).status_code, 400)
+
+    def test_subscribe_self(self):
+        url = f"/api/users/{self.user.pk}/subscribe/"
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertFalse(Follow.objects.filter(user=self.user).exists())
+
+
+class BulkRelationsTest(FoodgramAPITestCase):
+    """Пакетное добавление и удаление связей"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = cls.create_users(5)
+        cls.recipes = [
+            cls.create_recipe(cls.authors[0], name=f"Рецепт {i}")
+            for i in range(5)
+        ]
+        cls.ids = [recipe.pk for recipe in cls.recipes]
+        for recipe in cls.recipes[:2]:
+            SelectedRecipes.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.authenticate(self.user)
+
+    def bulk(self, relation, add=(), remove=()):
+        return self.client.post(
+            f"/api/{relation}/bulk/",
+            {"add": list(add), "remove": list(remove)},
+            format="json",
+        )
+
+    def assert_favorites(self, ids):
+        self.assertEqual(
+            set(
+                SelectedRecipes.objects.filter(user=self.user).values_list(
+                    "recipe_id", flat=True
+                )
+            ),
+            set(ids),
+        )
+        counts = dict(Recipes.objects.values_list("pk", "favorites_count"))
+        self.assertEqual(
+            counts, {pk: int(pk in ids) for pk in self.ids}
+        )
+
+    def test_sync(self):
+        response = self.bulk(
+            "recipes/favorite",
+            # Уже добавленный, повторяющийся и новые id
+            add=[self.ids[1], self.ids[2], self.ids[2], self.ids[3]],
+            # Добавленный и отсутствующий в избранном id
+            remove=[self.ids[0], self.ids[4]],
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data,
+            {"added": sorted(self.ids[2:4]), "removed": [self.ids[0]]},
+        )
+        self.assert_favorites(self.ids[1:4])
+
+        response = self.bulk("recipes/favorite", add=self.ids[1:4])
+        self.assertEqual(response.data, {"added": [], "removed": []})
+        self.assert_favorites(self.ids[1:4])
+
+    def test_missing_ids(self):
+        missing = max(self.ids) + 1
+        response = self.bulk(
+            "recipes/favorite",
+            add=[self.ids[2], missing],
+            remove=[self.ids[0], missing + 1],
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["ids"], [missing, missing + 1])
+        self.assert_favorites(self.ids[:2])
+
+    def test_invalid(self):
+        too_many = self.ids[:1] * (settings.BULK_RELATIONS_LIMIT + 1)
+        for add, remove in (
+            (too_many, []),
+            ([0], []),
+            (["id"], []),
+            (self.ids[1:3], self.ids[2:4]),
+        ):
+            with self.subTest(add=add[:5], remove=remove):
+                response = self.bulk("recipes/favorite", add, remove)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data["non_field_errors"],
+            ["Один и тот же id нельзя добавить и удалить"],
+        )
+        self.assert_favorites(self.ids[:2])
+
+    def test_shopping_cart(self):
+        response = self.bulk("recipes/shopping_cart", add=self.ids[:3])
+        self.assertEqual(response.data["added"], self.ids[:3])
+        response = self.bulk("recipes/shopping_cart", remove=self.ids[1:])
+        self.assertEqual(response.data["removed"], self.ids[1:3])
+        self.assertEqual(
+            list(
+                Recipes.objects.filter(cart_count=1).values_list(
+                    "pk", flat=True
+                )
+            ),
+            self.ids[:1],
+        )
+
+    def test_subscribe(self):
+        author_ids = [author.pk for author in self.authors]
+        response = self.bulk(
+            "users/subscribe", add=author_ids + [self.user.pk]
+        )
+        # Подписка на себя нарушает ограничение базы
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+        response = self.bulk("users/subscribe", add=author_ids)
+        self.assertEqual(response.data["added"], author_ids)
+        response = self.bulk("users/subscribe", remove=author_ids[:2])
+        self.assertEqual(response.data["removed"], author_ids[:2])
+        self.assertEqual(
+            list(
+                Follow.objects.filter(user=self.user)
+                .order_by("author")
+                .values_list("author_id", flat=True)
+            ),
+            author_ids[2:],
+        )
+
+
+def encode_image(color, size=(4, 4)):
+    """PNG заданного цвета в base64 для поля картинки рецепта"""
+
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return "data:image/png;base64," + b64encode(buffer.getvalue()).decode()
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class SharedImagesTest(FoodgramAPITestCase):
+    """
+    Картинки хранятся по содержимому: одинаковые загрузки дают один
+    файл, файл удаляется вместе с последней ссылкой на него
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = cls.create_users(1)
+        cls.tags = cls.create_tags(1)
+        cls.ingredients = cls.create_ingredients(1)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.authenticate(self.user)
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.media_root)
+            for path, _, names in os.walk(self.media_root)
+            for name in names
+        )
+
+    def post(self, name, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                "/api/recipes/",
+                {
+                    "name": name,
+                    "text": "Описание",
+                    "cooking_time": 5,
+                    "image": image,
+                    "tags": [self.tags[0].id],
+                    "ingredients": [
+                        {"id": self.ingredients[0].id, "amount": 1}
+                    ],
+                },
+                format="json",
+            )
+
+    def create(self, name, image):
+        response = self.post(name, image)
+        self.assertEqual(response.status_code, 201)
+        return Recipes.objects.get(pk=response.data["id"])
+
+    def delete(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.delete(f"/api/recipes/{recipe.pk}/")
+        self.assertEqual(response.status_code, 204)
+
+    def test_invalid_image(self):
+        buffer = io.BytesIO()
+        Image.new("RGB", (4, 4), "red").save(buffer, "PNG")
+        # Верный заголовок PNG, испорченные данные после него
+        content = buffer.getvalue()[:16] + b"\0" * 64
+        response = self.post(
+            "Рецепт",
+            "data:image/png;base64," + b64encode(content).decode(),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("image", response.data)
+        self.assertFalse(Recipes.objects.exists())
+        self.assertEqual(self.files(), [])
+
+    @staticmethod
+    def image_names(recipe):
+        return [
+            recipe.image.name,
+            recipe.image_thumbnail.name,
+            recipe.image_detail.name,
+        ]
+
+    def assert_files(self, *recipes):
+        """На диске только файлы картинок recipes"""
+
+        names = {
+            name for recipe in recipes for name in self.image_names(recipe)
+        }
+        self.assertEqual(self.files(), sorted(names))
+
+    def test_same_image_stored_once(self):
+        first = self.create("Первый", encode_image("red"))
+        second = self.create("Второй", encode_image("red"))
+        self.assertEqual(self.image_names(first), self.image_names(second))
+        self.assertNotIn("", self.image_names(first))
+        self.assert_files(first)
+
+    def test_shared_image_survives_delete(self):
+        first = self.create("Первый", encode_image("red"))
+        second = self.create("Второй", encode_image("red"))
+        other = self.create("Другой", encode_image("blue"))
+        self.assert_files(first, other)
+
+        self.delete(first)
+        self.assert_files(second, other)
+
+        self.delete(second)
+        self.assert_files(other)
+        self.assertEqual(
+            set(StoredFile.objects.values_list("name", flat=True)),
+            set(self.image_names(other)),
+        )
+
+    def test_replaced_image_deleted(self):
+        first = self.create("Первый", encode_image("red"))
+        second = self.create("Второй", encode_image("red"))
+        old = self.image_names(first)
+        for recipe in (first, second):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(
+                    f"/api/recipes/{recipe.pk}/",
+                    {
+                        "image": encode_image("green"),
+                        "tags": [self.tags[0].id],
+                        "ingredients": [
+                            {"id": self.ingredients[0].id, "amount": 1}
+                        ],
+                    },
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 200)
+            recipe.refresh_from_db()
+            # Старые файлы остаются, пока на них ссылается второй рецепт
+            self.assert_files(first, second)
+        self.assertEqual(self.image_names(first), self.image_names(second))
+        self.assert_files(first)
+        self.assertTrue(set(old).isdisjoint(self.files()))
+
+
+class IngredientSearchTest(FoodgramAPITestCase):
+    """Поиск ингридиентов индексом в памяти и запросом к базе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            "salt",
+            "Salt sea",
+            "sea salt",
+            "Basalt",
+            "SALTY",
+            "unsalted",
+            "sugar",
+            "Sugar brown",
+        ):
+            Ingredient.objects.create(name=name, measurement_unit="г")
+
+    def setUp(self):
+        ingredients_index.invalidate()
+
+    def search(self, name, index, etag=None):
+        headers = {"HTTP_IF_NONE_MATCH": etag} if etag else {}
+        with override_settings(INGREDIENTS_INDEX=index):
+            return self.client.get(
+                "/api/ingredients/", {"name": name}, **headers
+            )
+
+    def test_same_order(self):
+        for name in ("salt", "SA", "s", "ugar", "salt s", "x"):
+            with self.subTest(name=name):
+                response = self.search(name, index=True)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.data, self.search(name, index=False).data
+                )
+
+    def test_conditional_get(self):
+        etag = self.search("salt", index=True)["ETag"]
+        with self.assertNumQueries(1):
+            response = self.search("salt", index=True, etag=etag)
+        self.assertEqual(response.status_code, 304)
+        Ingredient.objects.create(name="salt rock", measurement_unit="г")
+        response = self.search("salt", index=True, etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("salt rock", [item["name"] for item in response.data])
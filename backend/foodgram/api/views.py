@@ -1,64 +1,160 @@
+from itertools import chain
+
 import django_filters.rest_framework as filters
-from core.params import SHOPPING_LIST, SUBCRIPTIONS
-from django.db.models import F, Q, Sum
-from django.http import HttpResponse
+from core.ingredients_index import ingredients_index
+from core.params import (INGREDIENTS_VERSION, RECIPE_VERSION, TAGS_VERSION,
+                         UrlParams)
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Prefetch, Sum
+from django.http import StreamingHttpResponse
 from recipes.models import (Ingredient, Recipes, SelectedRecipes, ShoppingList,
                             Tags)
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.generics import ListAPIView, RetrieveAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet, ModelViewSet
 
-from .filters import IngredientsFilter, RcipeFilter
-from .mixins import AddManyToManyFieldMixin
-from .paginators import PageLimitPagination
+from .cache import recipe_list_cache
+from .filters import IngredientSearchFilter, RcipeFilter
+from .mixins import AddManyToManyFieldMixin, ConditionalGetMixin
+from .paginators import PageLimitPagination, SearchLimitPagination
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
+from .read_serializers import RecipeReadSerializer
+from .renderers import ShoppingListCSVRenderer, ShoppingListTextRenderer
 from .serializers import (IngredientSerializer, RecipeSerializer,
-                          RecipeShortSerializer, TagSerializer)
+                          RecipeShortSerializer, TagSerializer,
+                          recipe_ingredients_prefetch)
 
 
 # ----------------Обработка запросов рецептов----------------
-class CreateRecipeView(ModelViewSet, AddManyToManyFieldMixin):
+class CreateRecipeView(
+    ConditionalGetMixin, ModelViewSet, AddManyToManyFieldMixin
+):
     """Создание, список и получение рецепта"""
 
     serializer_class = RecipeSerializer
     queryset = Recipes.objects.all()
+    permission_classes = (AllowAny,)
     pagination_class = PageLimitPagination
+    cursor_ordering = ("-pub_date", "-id")
+    count_strategy = "exact"
     serializers_for_mixin = RecipeShortSerializer
+    version_names = (TAGS_VERSION, INGREDIENTS_VERSION)
+    conditional_actions = ("retrieve",)
+    vary_on_user = True
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RcipeFilter
+    query_budgets = {
+        "list": 5,
+        "retrieve": 5,
+        "create": 18,
+        "update": 21,
+        "partial_update": 21,
+        "destroy": 12,
+        "favorite": 7,
+        "shopping_cart": 7,
+        "favorite_bulk": 9,
+        "shopping_cart_bulk": 9,
+        "download_shopping_cart": 2,
+    }
 
     def get_permissions(self):
         if self.action in ("update", "partial_update", "destroy"):
             self.permission_classes = (IsAuthorOrReadOnly,)
-        else:
-            self.permission_classes = (AllowAny,)
         return super().get_permissions()
 
-    def get_serializer_context(self):
+    def get_version_names(self):
         """
-        Добавление в контекст списка избранных и списка покупок для
-        проверки в сериализаторе
+        Рецепт зависит от справочников, своей версии и версии избранного
+        и списка покупок пользователя, общей версии рецептов нет
         """
 
-        context = super().get_serializer_context()
-        context.update(self.fill_context(SUBCRIPTIONS, SelectedRecipes))
-        context.update(self.fill_context(SHOPPING_LIST, ShoppingList))
+        return [
+            *super().get_version_names(),
+            RECIPE_VERSION.format(self.kwargs[self.lookup_field]),
+        ]
+
+    def get_serializer_class(self):
+        if (
+            settings.FAST_READ_SERIALIZERS
+            and self.action in ("list", "retrieve")
+            and self.request.method == "GET"
+        ):
+            return RecipeReadSerializer
+        return super().get_serializer_class()
+
+    def get_queryset(self):
+        """
+        Подгружает автора, теги и ингридиенты рецептов заранее, чтобы
+        количество запросов не зависело от размера страницы.
+        Для авторизованного пользователя признаки избранного и списка
+        покупок вычисляются подзапросами EXISTS. Для удаления нужен
+        только автор
+        """
 
-        return context
+        queryset = super().get_queryset().select_related("author")
+        if self.action == "destroy":
+            return queryset
+        queryset = queryset.prefetch_related(
+            Prefetch("tags", queryset=Tags.objects.all()),
+            recipe_ingredients_prefetch(),
+        )
 
-    def fill_context(self, name_context, model):
-        """Вспомогательный метод для заполнения контекста"""
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset
 
-        return {
-            name_context: set(
-                model.objects.filter(user=self.request.user).values_list(
-                    "recipe_id", flat=True
+        return queryset.annotate(
+            is_favorited=Exists(
+                SelectedRecipes.objects.filter(
+                    user=user, recipe=OuterRef("pk")
                 )
-            )
-        }
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingList.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+        )
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.rows_affected = serializer.rows_affected
+
+    def update(self, request, *args, **kwargs):
+        """Добавляет в ответ количество измененных в базе строк"""
+
+        response = super().update(request, *args, **kwargs)
+        response["X-Rows-Affected"] = self.rows_affected
+        return response
+
+    def list(self, request, *args, **kwargs):
+        """
+        Страницы списка для анонимных пользователей отдаются из кэша,
+        заголовок X-Cache показывает попадание в кэш
+        """
+
+        key = recipe_list_cache.get_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+
+        data = recipe_list_cache.get(key)
+        if data is not None:
+            return Response(data, headers={"X-Cache": "HIT"})
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            recipe_list_cache.set(key, response.data)
+        response["X-Cache"] = "MISS"
+        return response
+
+    @action(
+        methods=("GET",), detail=False, permission_classes=(IsAdminUser,)
+    )
+    def cache_stats(self, request):
+        """Счетчики попаданий и промахов кэша списка рецептов"""
+
+        return Response(recipe_list_cache.stats())
 
     @action(
         methods=("GET", "POST", "DELETE"),
@@ -69,7 +165,7 @@ class CreateRecipeView(ModelViewSet, AddManyToManyFieldMixin):
         """Добавление, удаление, рецепта в список избранных"""
 
         return self.delete_create_many_to_many(
-            pk, SelectedRecipes, Q(recipe=pk)
+            pk, SelectedRecipes, "recipe"
         )
 
     @action(
@@ -81,62 +177,127 @@ class CreateRecipeView(ModelViewSet, AddManyToManyFieldMixin):
         """Добавление, удаление, выдача рецепта в список покупок"""
 
         return self.delete_create_many_to_many(
-            pk, ShoppingList, Q(recipe__id=pk)
+            pk, ShoppingList, "recipe"
         )
 
     @action(
-        methods=("GET",), detail=False, permission_classes=(IsAuthenticated,)
+        methods=("POST",),
+        detail=False,
+        url_path="favorite/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_bulk(self, request):
+        """
+        Пакетное добавление и удаление рецептов в избранном,
+        тело запроса: {"add": [id, ...], "remove": [id, ...]}
+        """
+
+        return self.bulk_many_to_many(SelectedRecipes, "recipe")
+
+    @action(
+        methods=("POST",),
+        detail=False,
+        url_path="shopping_cart/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_bulk(self, request):
+        """Пакетное добавление и удаление рецептов в списке покупок"""
+
+        return self.bulk_many_to_many(ShoppingList, "recipe")
+
+    @action(
+        methods=("GET",),
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(ShoppingListTextRenderer, ShoppingListCSVRenderer),
     )
     def download_shopping_cart(self, request):
-        """Отдача пользователю списка покупок"""
+        """
+        Потоковая отдача пользователю списка покупок.
+        Формат файла задается параметром format (txt, csv)
+        """
 
         user = self.request.user
-        if not user.shopping_list.exists():
-            return Response(
-                {"message": "Список покупок пуст"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        file_name = f"shopping_list_{user.username}.txt"
-        shopping_list = [f"Покупки пользователя {user.username}:\n\n"]
+        renderer = request.accepted_renderer
 
         # Объединия ингридиенты с одинаковым названием и единицей измерения
         ingredients = (
             Ingredient.objects.filter(recipes__in_shopping_list__user=user)
             .values("name", measurement=F("measurement_unit"))
             .annotate(amount=Sum("recipeingregient__amount"))
+            .iterator()
         )
 
-        for ingredient in ingredients:
-            shopping_list.append(
-                f'{ingredient["name"]} {ingredient["amount"]}'
-                f' - ({ingredient["measurement"]}); \n'
+        first_ingredient = next(ingredients, None)
+        if first_ingredient is None:
+            return Response(
+                {"message": "Список покупок пуст"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
-        response = HttpResponse(
-            shopping_list, content_type="text/plain", charset="utf-8"
+        file_name = f"shopping_list_{user.username}.{renderer.format}"
+        response = StreamingHttpResponse(
+            renderer.stream(
+                user.username, chain((first_ingredient,), ingredients)
+            ),
+            content_type=renderer.media_type,
+            charset=renderer.charset,
         )
         response["Content-Disposition"] = f'attachment; filename="{file_name}"'
         return response
 
 
 # ----------------Получение ингридиентов с поиском----------------
-class GetIngredientsView(ListAPIView, RetrieveAPIView, GenericViewSet):
-    """Получение списка ингридиентов с возможностью поиска в начале строки"""
+class GetIngredientsView(
+    ConditionalGetMixin, ListAPIView, RetrieveAPIView, GenericViewSet
+):
+    """
+    Получение списка ингридиентов с поиском по названию,
+    совпадения с начала строки идут первыми
+    """
 
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (IsAdminOrReadOnly,)
-    pagination_class = None
-    filter_backends = (filters.DjangoFilterBackend,)
-    filterset_class = IngredientsFilter
+    pagination_class = SearchLimitPagination
+    filter_backends = (IngredientSearchFilter,)
+    version_names = (INGREDIENTS_VERSION,)
+    query_budgets = {"list": 3, "retrieve": 3}
+
+    def list(self, request, *args, **kwargs):
+        """
+        При включенном INGREDIENTS_INDEX поиск по названию обслуживается
+        индексом в памяти процесса, к базе данных выполняется только
+        запрос версии для ETag
+        """
+
+        if (
+            request.query_params.get(UrlParams.NAME.value)
+            and settings.INGREDIENTS_INDEX
+        ):
+            return self.conditional_response(
+                self.search_index, request, *args, **kwargs
+            )
+        return super().list(request, *args, **kwargs)
+
+    def search_index(self, request, *args, **kwargs):
+        return Response(
+            ingredients_index.search(
+                request.query_params[UrlParams.NAME.value],
+                settings.INGREDIENTS_SEARCH_LIMIT,
+            )
+        )
 
 
 # ----------------Получение тегов----------------
-class GetTagsView(ListAPIView, RetrieveAPIView, GenericViewSet):
+class GetTagsView(
+    ConditionalGetMixin, ListAPIView, RetrieveAPIView, GenericViewSet
+):
     """Получение списка тегов"""
 
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Tags.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    version_names = (TAGS_VERSION,)
+    query_budgets = {"list": 3, "retrieve": 3}
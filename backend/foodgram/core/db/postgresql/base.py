@@ -0,0 +1,150 @@
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Пул соединений процесса: не больше max_size выданных соединений,
+    из возвращенных хранится не больше idle_size простаивающих
+    """
+
+    def __init__(self, connect, max_size, idle_size, timeout):
+        self.connect = connect
+        self.idle_size = idle_size
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def get(self):
+        """Соединение из пула и признак того, что оно уже использовалось"""
+
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError("Database connection pool exhausted")
+        try:
+            with self._lock:
+                if self._idle:
+                    return self._idle.pop(), True
+            return self.connect(), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def put(self, connection, discard=False):
+        try:
+            reusable = (
+                not discard
+                and not connection.closed
+                and connection.info.transaction_status
+                == extensions.TRANSACTION_STATUS_IDLE
+            )
+            with self._lock:
+                if reusable and len(self._idle) < self.idle_size:
+                    self._idle.append(connection)
+                    return
+            connection.close()
+        finally:
+            self._slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Postgres с проверкой соединений и пулом соединений процесса.
+
+    CONN_HEALTH_CHECKS: повторно используемое соединение проверяется
+    запросом SELECT 1 перед первым обращением к базе в каждом запросе,
+    разорванное соединение заменяется новым.
+
+    POOL: {"MAX_SIZE", "IDLE_SIZE", "TIMEOUT"}. Закрытие соединения
+    возвращает его в пул, поэтому соединения переиспользуются и при
+    CONN_MAX_AGE = 0, и в режиме ASGI, где у каждого запроса свой поток.
+    С пулом допустим только CONN_MAX_AGE = 0: иначе соединение остается
+    в потоке после запроса, а в режиме ASGI поток завершается, и его
+    соединение не возвращается в пул
+    """
+
+    health_check_done = False
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        if settings_dict.get("POOL") and settings_dict["CONN_MAX_AGE"] != 0:
+            raise ImproperlyConfigured(
+                "CONN_MAX_AGE must be 0 when POOL is enabled"
+            )
+        super().__init__(settings_dict, *args, **kwargs)
+
+    @property
+    def pool(self):
+        settings = self.settings_dict.get("POOL")
+        if not settings:
+            return None
+        with _pools_lock:
+            if self.alias not in _pools:
+                _pools[self.alias] = ConnectionPool(
+                    lambda: super(DatabaseWrapper, self).get_new_connection(
+                        self.get_connection_params()
+                    ),
+                    settings["MAX_SIZE"],
+                    settings["IDLE_SIZE"],
+                    settings["TIMEOUT"],
+                )
+            return _pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            self.health_check_done = True
+            return super().get_new_connection(conn_params)
+
+        while True:
+            connection, reused = pool.get()
+            if not reused or not self.settings_dict.get("CONN_HEALTH_CHECKS"):
+                break
+            if self.is_connection_usable(connection):
+                break
+            pool.put(connection, discard=True)
+
+        self.health_check_done = True
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.settings_dict.get("CONN_HEALTH_CHECKS")
+            and not self.health_check_done
+        ):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # Вызывается в начале и в конце каждого запроса
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.put(self.connection)
+        return None
+
+    @staticmethod
+    def is_connection_usable(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except base.Database.Error:
+            return False
+        return True
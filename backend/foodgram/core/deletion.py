@@ -0,0 +1,47 @@
+import threading
+from collections import defaultdict
+
+from django.db import connections, transaction
+
+
+class CascadeDeletion:
+    """
+    Рецепты и пользователи, удаляемые в текущей транзакции.
+
+    Обработчики post_delete связей (избранное, список покупок,
+    ингридиенты рецепта) пропускают записи удаляемых рецептов и
+    пользователей: счетчики и версии таких записей обновляются одним
+    запросом в pre_delete или не нужны вовсе. Пометки действуют до конца
+    транзакции: их сброс ставится в очередь on_commit соединения, при
+    откате очередь очищается, и пометки перестают действовать
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def get_marks(self, using, create=False):
+        marks = getattr(self.local, "marks", None)
+        connection = connections[using]
+        if marks is not None and any(
+            func == marks.clear for _, func in connection.run_on_commit
+        ):
+            return marks
+
+        marks = defaultdict(set)
+        if create and connection.in_atomic_block:
+            self.local.marks = marks
+            transaction.on_commit(marks.clear, using=using)
+        return marks
+
+    def add(self, instance, using):
+        """Помечает запись как удаляемую в текущей транзакции"""
+
+        self.get_marks(using, create=True)[type(instance)].add(instance.pk)
+
+    def contains(self, model, pk, using):
+        """Удаляется ли запись в текущей транзакции"""
+
+        return pk in self.get_marks(using).get(model, ())
+
+
+cascade_deletion = CascadeDeletion()
@@ -0,0 +1,108 @@
+import io
+from pathlib import PurePosixPath
+
+from api.cache import recipe_list_cache
+from api.models import StoredFile, TableVersion
+from core.params import RECIPE_VERSION
+from core.tasks import task_queue
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+from recipes.models import Recipes
+
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+IMAGE_FIELDS = ("image", "image_thumbnail", "image_detail")
+
+
+def get_variant_sizes():
+    """Наибольшая сторона каждого варианта картинки рецепта"""
+
+    return {
+        "thumbnail": settings.RECIPE_IMAGE_THUMBNAIL_SIZE,
+        "detail": settings.RECIPE_IMAGE_DETAIL_SIZE,
+    }
+
+
+def process_recipe_image(recipe_id, name):
+    """
+    Строит уменьшенные варианты картинки рецепта и сохраняет их в модели.
+    Если картинка рецепта за это время сменилась, варианты удаляются
+    """
+    storage = Recipes._meta.get_field("image").storage
+    image_format = settings.RECIPE_IMAGE_FORMAT
+
+    with storage.open(name) as f:
+        image = Image.open(f)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    has_alpha = image.mode in ("RGBA", "LA", "P") and image_format == "WEBP"
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    stem = PurePosixPath(name).stem
+    contents = {}
+    for variant, size in get_variant_sizes().items():
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        resized.save(
+            buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY
+        )
+        field = Recipes._meta.get_field(f"image_{variant}")
+        filename = field.generate_filename(
+            None, f"{stem}_{variant}.{EXTENSIONS[image_format]}"
+        )
+        contents[field.name] = (filename, buffer.getvalue())
+
+    # Файлы вариантов остаются заблокированными до сохранения ссылок
+    with transaction.atomic():
+        variants = {
+            field: storage.save(filename, ContentFile(content))
+            for field, (filename, content) in contents.items()
+        }
+        if not Recipes.objects.filter(pk=recipe_id, image=name).update(
+            **variants
+        ):
+            delete_images(*variants.values())
+            return
+
+    TableVersion.bump(RECIPE_VERSION.format(recipe_id))
+    recipe_list_cache.invalidate_recipe(Recipes.objects.get(pk=recipe_id))
+
+
+def delete_images(*names):
+    """
+    Удаление файлов картинок, на которые не ссылается ни один рецепт.
+    Одинаковые картинки хранятся одним файлом (core.storage), проверка
+    ссылок и удаление выполняются под блокировкой строк файлов
+    """
+    storage = Recipes._meta.get_field("image").storage
+    names = {name for name in names if name}
+    if not names:
+        return
+    with transaction.atomic(savepoint=False):
+        # Ждет транзакции, сохраняющие ссылки на эти файлы
+        StoredFile.lock(*names)
+        referenced = set()
+        for field in IMAGE_FIELDS:
+            referenced.update(
+                Recipes.objects.filter(
+                    **{f"{field}__in": names}
+                ).values_list(field, flat=True)
+            )
+        unused = names - referenced
+        StoredFile.objects.filter(name__in=unused).delete()
+        for name in unused:
+            storage.delete(name)
+
+
+def schedule_image_processing(recipe):
+    """Фоновое построение вариантов картинки рецепта"""
+
+    task_queue.submit(process_recipe_image, recipe.pk, recipe.image.name)
+
+
+def schedule_images_deletion(*files):
+    """Фоновое удаление файлов картинки рецепта и ее вариантов"""
+
+    task_queue.submit(delete_images, *(file.name for file in files))
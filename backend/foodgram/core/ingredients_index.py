@@ -0,0 +1,83 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from recipes.models import Ingredient
+
+
+class IngredientsIndex:
+    """
+    Индекс ингридиентов в памяти процесса для поиска по названию.
+    Хранит ингридиенты в порядке базы данных (ORDER BY name) и
+    отсортированный по casefold названию массив ключей, в котором
+    совпадения с начала строки ищутся бинарным поиском, не обращаясь к
+    базе данных. Порядок выдачи тот же, что у IngredientSearchFilter.
+
+    Индекс строится лениво при первом поиске. Сигналы модели Ingredient
+    и команда lo_in сбрасывают его в текущем процессе, остальные процессы
+    (воркеры gunicorn) перестраивают индекс по истечении
+    INGREDIENTS_INDEX_TTL секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        """Сбрасывает индекс, он будет перестроен при следующем поиске"""
+        self._index = None
+
+    def _is_stale(self):
+        return (
+            self._index is None
+            or time.monotonic() - self._built_at
+            > settings.INGREDIENTS_INDEX_TTL
+        )
+
+    def _build(self):
+        entries = list(
+            Ingredient.objects.order_by("name").values(
+                "id", "name", "measurement_unit"
+            )
+        )
+        names = [entry["name"].casefold() for entry in entries]
+        # Позиции записей в порядке casefold названий
+        positions = sorted(range(len(entries)), key=names.__getitem__)
+        keys = [names[position] for position in positions]
+        self._index = (keys, positions, names, entries)
+        self._built_at = time.monotonic()
+
+    def _get(self):
+        with self._lock:
+            if self._is_stale():
+                self._build()
+            return self._index
+
+    def search(self, name, limit):
+        """
+        Возвращает не более limit ингридиентов, в названии которых есть
+        строка name. Совпадения с начала строки идут первыми, внутри
+        каждой группы - в порядке базы данных
+        """
+        keys, positions, names, entries = self._get()
+        name = name.casefold()
+
+        prefixed = []
+        for index in range(bisect_left(keys, name), len(keys)):
+            if not keys[index].startswith(name):
+                break
+            prefixed.append(positions[index])
+        result = [entries[position] for position in sorted(prefixed)[:limit]]
+
+        for key, entry in zip(names, entries):
+            if len(result) >= limit:
+                break
+            if name in key and not key.startswith(name):
+                result.append(entry)
+
+        return result
+
+
+ingredients_index = IngredientsIndex()
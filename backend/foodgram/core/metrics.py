@@ -0,0 +1,151 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from core.profiling import QueryRecorder
+from django.http import HttpResponse
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from rest_framework.serializers import ListSerializer
+
+UNMATCHED = "unmatched"
+
+REQUEST_DURATION = Histogram(
+    "foodgram_request_duration_seconds",
+    "Request processing time",
+    ("view", "method"),
+)
+REQUESTS = Counter(
+    "foodgram_requests_total",
+    "Processed requests",
+    ("view", "method", "status"),
+)
+DB_QUERIES = Histogram(
+    "foodgram_db_queries",
+    "Database queries per request",
+    ("view",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, float("inf")),
+)
+DB_DURATION = Histogram(
+    "foodgram_db_duration_seconds",
+    "Database time per request",
+    ("view",),
+)
+SERIALIZER_DURATION = Histogram(
+    "foodgram_serializer_duration_seconds",
+    "Serialization time per request",
+    ("view",),
+)
+RESPONSE_SIZE = Histogram(
+    "foodgram_response_size_bytes",
+    "Response body size",
+    ("view",),
+    buckets=tuple(256 * 4 ** power for power in range(8)) + (float("inf"),),
+)
+CACHE_REQUESTS = Counter(
+    "foodgram_cache_requests_total",
+    "Responses served from or stored to the recipe list cache",
+    ("view", "result"),
+)
+
+# Время сериализации текущего запроса, заполняется MetricsMiddleware
+request_timings = ContextVar("request_timings", default=None)
+
+
+def get_view_name(request):
+    """
+    Имя маршрута для меток: действие viewset вида recipes-list,
+    users-subscriptions
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None or not match.url_name:
+        return UNMATCHED
+    return match.url_name
+
+
+class MetricsMiddleware:
+    """
+    Гистограммы времени запроса, количества и времени запросов к базе,
+    времени сериализации и размера ответа по каждому маршруту,
+    попадания в кэш списка рецептов по заголовку X-Cache
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = {"serializer": 0.0}
+        token = request_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with QueryRecorder() as recorder:
+                response = self.get_response(request)
+        finally:
+            request_timings.reset(token)
+        duration = time.perf_counter() - started
+
+        view = get_view_name(request)
+        if view == "metrics":
+            return response
+
+        REQUEST_DURATION.labels(view, request.method).observe(duration)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        DB_QUERIES.labels(view).observe(len(recorder.queries))
+        DB_DURATION.labels(view).observe(recorder.duration)
+        SERIALIZER_DURATION.labels(view).observe(timings["serializer"])
+        if not response.streaming:
+            RESPONSE_SIZE.labels(view).observe(len(response.content))
+        if response.has_header("X-Cache"):
+            CACHE_REQUESTS.labels(view, response["X-Cache"].lower()).inc()
+        return response
+
+
+class MeasuredSerializerMixin:
+    """
+    Учитывает время to_representation в метриках запроса. Время
+    считается только для сериализатора верхнего уровня или элементов
+    списка верхнего уровня, вложенные сериализаторы входят в него
+    """
+
+    def to_representation(self, instance):
+        parent = self.parent
+        if request_timings.get() is None or not (
+            parent is None
+            or isinstance(parent, ListSerializer)
+            and parent.parent is None
+        ):
+            return super().to_representation(instance)
+
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+@contextmanager
+def serializer_timer():
+    """Добавляет время выполнения блока ко времени сериализации запроса"""
+
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings["serializer"] += time.perf_counter() - started
+
+
+def metrics(request):
+    """
+    Метрики в формате Prometheus. При запуске нескольких воркеров
+    (PROMETHEUS_MULTIPROC_DIR) собираются метрики всех воркеров
+    """
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
@@ -1,13 +1,24 @@
 from enum import Enum
 
 SUBSCRIBED = "subscribed"
-SUBCRIPTIONS = "subscriptions"
-SHOPPING_LIST = "shopping_list"
+
+# Названия счетчиков версий данных для ETag
+TAGS_VERSION = "tags"
+INGREDIENTS_VERSION = "ingredients"
+# Версия отдельного рецепта и версия признаков пользователя
+# (избранное, список покупок), форматируются по id
+RECIPE_VERSION = "recipe:{}"
+USER_VERSION = "user:{}"
+
+# Режим фильтра по тегам: рецепт должен иметь все теги
+TAGS_MODE_ALL = "all"
 
 
 class UrlParams(str, Enum):
     # Параметр тегов
     TAGS = "tags"
+    # Параметр режима фильтра по тегам (any, all)
+    TAGS_MODE = "tags_mode"
     # Параметр ингридиентов
     INGREDIENTS = "name"
     # Параметр избранного
@@ -0,0 +1,122 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import resolve
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+
+def fingerprint(sql):
+    """SQL без значений параметров: одинаковые запросы в цикле совпадают"""
+
+    return IN_LISTS.sub("(...)", LITERALS.sub("?", sql))
+
+
+def get_query_budget(view_func, method):
+    """
+    Допустимое количество запросов к базе для действия представления:
+    атрибут query_budgets представления ({действие: количество}),
+    иначе QUERY_BUDGET_DEFAULT. Бюджет учитывает запрос аутентификации
+    """
+    view_class = getattr(view_func, "cls", None)
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(method.lower())
+    budgets = getattr(view_class, "query_budgets", {})
+    return budgets.get(action, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryRecorder:
+    """Запоминает SQL и время выполнения запросов ко всем базам"""
+
+    def __init__(self):
+        self.queries = []
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.queries.append(sql)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def duplicates(self):
+        """Повторяющиеся отпечатки запросов и их количество"""
+
+        counts = Counter(fingerprint(sql) for sql in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+
+class QueryProfilingMiddleware:
+    """
+    Считает запросы к базе и их время для каждого запроса и отдает их в
+    заголовках X-Query-Count и Server-Timing. Запросы, превысившие бюджет
+    представления (get_query_budget), пишутся в лог вместе с
+    повторяющимися SQL
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        count = len(recorder.queries)
+        response["X-Query-Count"] = str(count)
+        response["Server-Timing"] = (
+            f'db;dur={recorder.duration * 1000:.1f};desc="{count} queries", '
+            f"total;dur={total * 1000:.1f}"
+        )
+
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            budget = get_query_budget(match.func, request.method)
+            if count > budget:
+                logger.warning(
+                    "%s %s (%s): %s queries, budget %s, duplicated: %s",
+                    request.method,
+                    request.path,
+                    match.view_name,
+                    count,
+                    budget,
+                    recorder.duplicates(),
+                )
+        return response
+
+
+def assert_query_budget(client, method, path, **kwargs):
+    """
+    Выполняет запрос тестовым клиентом и падает с AssertionError, если
+    представление выполнило больше запросов, чем его бюджет
+    """
+    with QueryRecorder() as recorder:
+        response = getattr(client, method.lower())(path, **kwargs)
+
+    budget = get_query_budget(resolve(path.split("?")[0]).func, method)
+    count = len(recorder.queries)
+    if count > budget:
+        raise AssertionError(
+            f"{method} {path}: {count} queries, budget {budget}, "
+            f"duplicated: {recorder.duplicates()}"
+        )
+    return response
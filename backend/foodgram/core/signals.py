@@ -1,14 +1,294 @@
-from pathlib import Path
-
-from django.db.models.signals import post_delete
+from api.cache import recipe_list_cache
+from api.mixins import relations_bulk_changed
+from api.models import TableVersion
+from core.deletion import cascade_deletion
+from core.images import schedule_images_deletion
+from core.ingredients_index import ingredients_index
+from core.params import (INGREDIENTS_VERSION, RECIPE_VERSION, TAGS_VERSION,
+                         USER_VERSION)
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.dispatch import receiver
-from recipes.models import Recipes
+from recipes.models import (Ingredient, RecipeIngregient, Recipes,
+                            SelectedRecipes, ShoppingList, Tags)
+
+User = get_user_model()
 
 
 @receiver(post_delete, sender=Recipes)
 def delete_old_image(sender, instance, **kwargs):
-    """Удаление файла изображения при удалении рецепта"""
+    """Фоновое удаление картинки и ее вариантов при удалении рецепта"""
+
+    schedule_images_deletion(
+        instance.image, instance.image_thumbnail, instance.image_detail
+    )
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_ingredients_index(sender, **kwargs):
+    """Сброс индекса ингридиентов при изменении справочника"""
+
+    ingredients_index.invalidate()
+    TableVersion.bump(INGREDIENTS_VERSION)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+def bump_tags_version(sender, **kwargs):
+    """Новая версия тегов при изменении тегов"""
+
+    TableVersion.bump(TAGS_VERSION)
+
+
+@receiver(post_save, sender=Recipes)
+def bump_recipe_version(sender, instance, created, **kwargs):
+    """Новая версия рецепта при его изменении"""
+
+    if not created:
+        TableVersion.bump(RECIPE_VERSION.format(instance.pk))
+
+
+@receiver(post_delete, sender=Recipes)
+def bump_deleted_recipe_version(sender, instance, **kwargs):
+    """
+    Новая версия удаленного рецепта: прежний ETag не совпадает,
+    и клиент получает 404 вместо 304. Версии рецептов удаляемого
+    пользователя обновляются одним запросом в delete_user_relations
+    """
+
+    if is_cascade_deleted(kwargs, user_id=instance.author_id):
+        return
+    TableVersion.bump(RECIPE_VERSION.format(instance.pk))
+
+
+@receiver(post_save, sender=RecipeIngregient)
+@receiver(post_delete, sender=RecipeIngregient)
+def bump_recipe_version_ingredients(sender, instance, **kwargs):
+    """Новая версия рецепта при изменении его ингридиентов"""
+
+    if is_cascade_deleted(kwargs, recipe_id=instance.recipe_id):
+        return
+    TableVersion.bump(RECIPE_VERSION.format(instance.recipe_id))
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def bump_recipe_version_tags(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """Новая версия рецептов при изменении тегов рецепта"""
+
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        TableVersion.bump(RECIPE_VERSION.format(instance.pk))
+    elif pk_set:
+        TableVersion.bump(*(RECIPE_VERSION.format(pk) for pk in pk_set))
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipes_version(sender, instance, created, **kwargs):
+    """Новые версии рецептов автора при изменении его данных"""
+
+    if created or is_login_update(kwargs):
+        return
+    TableVersion.bump(
+        *(
+            RECIPE_VERSION.format(pk)
+            for pk in instance.recipes.values_list("pk", flat=True)
+        )
+    )
+
+
+@receiver(post_save, sender=SelectedRecipes)
+@receiver(post_delete, sender=SelectedRecipes)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def bump_user_version(sender, instance, **kwargs):
+    """
+    Новая версия признаков избранного и списка покупок пользователя.
+    Версии рецептов и общие версии не меняются
+    """
+
+    if is_cascade_deleted(
+        kwargs, recipe_id=instance.recipe_id, user_id=instance.user_id
+    ):
+        return
+    TableVersion.bump(USER_VERSION.format(instance.user_id))
+
+
+def is_login_update(kwargs):
+    """Сохранение пользователя при входе меняет лишь last_login"""
+
+    return kwargs.get("update_fields") == frozenset(("last_login",))
+
+
+def is_cascade_deleted(kwargs, recipe_id=None, user_id=None):
+    """
+    Запись удаляется вместе со своим рецептом или пользователем,
+    помеченными в pre_delete (core.deletion). Версии удаляемых рецептов
+    все равно меняются: в bump_deleted_recipe_version или одним
+    запросом в delete_user_relations
+    """
+
+    using = kwargs["using"]
+    return kwargs["signal"] is post_delete and (
+        cascade_deletion.contains(Recipes, recipe_id, using)
+        or cascade_deletion.contains(User, user_id, using)
+    )
+
+
+@receiver(pre_delete, sender=Recipes)
+def mark_recipe_deletion(sender, instance, using, **kwargs):
+    """
+    Связи удаляемого рецепта удаляются без обновления счетчиков, версий
+    и кэша по одной строке: рецепт со счетчиками удаляется, страницы
+    списка сбрасываются один раз в invalidate_recipe_list
+    """
+
+    cascade_deletion.add(instance, using)
+
+
+@receiver(pre_delete, sender=User)
+def delete_user_relations(sender, instance, using, **kwargs):
+    """
+    Счетчики чужих рецептов из избранного и списка покупок удаляемого
+    пользователя уменьшаются одним запросом на счетчик, версии его
+    рецептов обновляются одним запросом. Каскадное удаление его записей
+    затем не обновляет их по одной строке
+    """
+
+    cascade_deletion.add(instance, using)
+    TableVersion.bump(
+        *(
+            RECIPE_VERSION.format(pk)
+            for pk in Recipes.objects.using(using)
+            .filter(author=instance)
+            .values_list("pk", flat=True)
+        )
+    )
+    for model, field in (
+        (SelectedRecipes, "favorites_count"),
+        (ShoppingList, "cart_count"),
+    ):
+        Recipes.objects.using(using).filter(
+            pk__in=model.objects.filter(user=instance).values("recipe"),
+            **{f"{field}__gt": 0},
+        ).exclude(author=instance).update(**{field: F(field) - 1})
+
+
+@receiver(post_save, sender=Recipes)
+@receiver(pre_delete, sender=Recipes)
+def invalidate_recipe_list(sender, instance, **kwargs):
+    """
+    Сброс страниц списка, на которых находится рецепт. У нового рецепта
+    тегов еще нет, страницы тегов сбрасываются при их добавлении
+    """
+
+    recipe_list_cache.invalidate_recipe(
+        instance, tags=() if kwargs.get("created") else None
+    )
+
+
+@receiver(post_save, sender=RecipeIngregient)
+@receiver(post_delete, sender=RecipeIngregient)
+def invalidate_recipe_list_ingredients(sender, instance, **kwargs):
+    """Сброс страниц списка при изменении ингридиентов рецепта"""
+
+    if is_cascade_deleted(kwargs, recipe_id=instance.recipe_id):
+        return
+    recipe_list_cache.invalidate_recipe(instance.recipe)
+
+
+@receiver(m2m_changed, sender=Recipes.tags.through)
+def invalidate_recipe_list_tags(
+    sender, instance, action, reverse, pk_set, **kwargs
+):
+    """
+    Сброс страниц списка при изменении тегов рецепта,
+    затрагиваются как добавленные, так и убранные теги
+    """
+
+    if reverse:
+        recipe_list_cache.invalidate(everything=True)
+    elif action in ("post_add", "post_remove"):
+        recipe_list_cache.invalidate_recipe(
+            instance,
+            tags=Tags.objects.filter(pk__in=pk_set).values_list(
+                "slug", flat=True
+            ),
+        )
+    elif action == "pre_clear":
+        recipe_list_cache.invalidate_recipe(instance)
+
+
+@receiver(post_save, sender=Tags)
+@receiver(post_delete, sender=Tags)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_recipe_list_everything(sender, **kwargs):
+    """Сброс всех страниц списка при изменении справочников и авторов"""
+
+    if not is_login_update(kwargs):
+        recipe_list_cache.invalidate(everything=True)
+
+
+def update_counter(queryset, field, kwargs):
+    """
+    Атомарное изменение счетчика без чтения строки: +1 для созданной
+    записи, -1 для удаленной. Счетчик не уходит ниже нуля
+    """
+
+    if kwargs["signal"] is post_delete:
+        queryset = queryset.filter(**{f"{field}__gt": 0})
+        queryset.update(**{field: F(field) - 1})
+    elif kwargs["created"]:
+        queryset.update(**{field: F(field) + 1})
+
+
+@receiver(post_save, sender=SelectedRecipes)
+@receiver(post_delete, sender=SelectedRecipes)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+def update_recipe_counters(sender, instance, **kwargs):
+    """Счетчики добавлений рецепта в избранное и в список покупок"""
+
+    if is_cascade_deleted(
+        kwargs, recipe_id=instance.recipe_id, user_id=instance.user_id
+    ):
+        return
+    field = "favorites_count" if sender is SelectedRecipes else "cart_count"
+    update_counter(
+        Recipes.objects.filter(pk=instance.recipe_id), field, kwargs
+    )
+
+
+@receiver(post_save, sender=Recipes)
+@receiver(post_delete, sender=Recipes)
+def update_author_recipes_count(sender, instance, **kwargs):
+    """Счетчик рецептов автора"""
+
+    if is_cascade_deleted(kwargs, user_id=instance.author_id):
+        return
+    update_counter(
+        User.objects.filter(pk=instance.author_id), "recipes_count", kwargs
+    )
+
+
+@receiver(relations_bulk_changed, sender=SelectedRecipes)
+@receiver(relations_bulk_changed, sender=ShoppingList)
+def update_recipe_counters_bulk(sender, added, removed, **kwargs):
+    """Счетчики рецептов и версия после пакетного изменения связей"""
 
-    image_path = Path(instance.image.path)
-    if image_path.exists():
-        image_path.unlink()
+    field = "favorites_count" if sender is SelectedRecipes else "cart_count"
+    if added:
+        Recipes.objects.filter(pk__in=added).update(**{field: F(field) + 1})
+    if removed:
+        Recipes.objects.filter(
+            pk__in=removed, **{f"{field}__gt": 0}
+        ).update(**{field: F(field) - 1})
+    TableVersion.bump(USER_VERSION.format(kwargs["user_id"]))
@@ -0,0 +1,47 @@
+import hashlib
+import posixpath
+
+from api.models import StoredFile
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+CHUNK_SIZE = 64 * 1024
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Хранилище файлов с именами по содержимому: каталог upload_to,
+    подкаталог из первых символов хэша и sha256 файла с расширением.
+
+    Повторная загрузка того же файла не записывает его заново, а
+    возвращает имя существующего. Поэтому файл может использоваться
+    несколькими рецептами, удалять его нужно только когда на него не
+    осталось ссылок (core.images.delete_images). Сохранение и удаление
+    блокируют строку файла (api.models.StoredFile) до конца транзакции,
+    поэтому файл не удаляется, пока сохраняется новая ссылка на него.
+    Содержимое по имени никогда не меняется, и /media/ можно кэшировать
+    без ограничения срока.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+
+        hexdigest = digest.hexdigest()
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(
+            posixpath.dirname(name), hexdigest[:2], hexdigest + extension
+        )
+        with transaction.atomic(savepoint=False):
+            StoredFile.lock(name)
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length)
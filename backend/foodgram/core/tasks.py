@@ -0,0 +1,57 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """
+    Очередь фоновых задач на пуле потоков текущего процесса.
+
+    Задачи ставятся после фиксации транзакции, чтобы воркер увидел
+    сохраненные данные. Пул создается лениво, уже после fork воркера
+    gunicorn. При BACKGROUND_TASKS_EAGER задачи выполняются сразу
+    в вызывающем потоке.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.BACKGROUND_TASKS_WORKERS,
+                    thread_name_prefix="tasks",
+                )
+            return self._executor
+
+    def submit(self, func, *args):
+        """Ставит задачу в очередь после фиксации текущей транзакции"""
+
+        transaction.on_commit(lambda: self._submit(func, *args))
+
+    def _submit(self, func, *args):
+        if settings.BACKGROUND_TASKS_EAGER:
+            self._run(func, *args, close_connections=False)
+        else:
+            self._get_executor().submit(self._run, func, *args)
+
+    @staticmethod
+    def _run(func, *args, close_connections=True):
+        try:
+            func(*args)
+        except Exception:
+            logger.exception("Background task %s failed", func.__name__)
+        finally:
+            if close_connections:
+                # Соединения потока пула не закрываются Django
+                connections.close_all()
+
+
+task_queue = TaskQueue()
@@ -0,0 +1,89 @@
+from core.profiling import assert_query_budget
+from django.contrib.auth import get_user_model
+from recipes.models import Ingredient, RecipeIngregient, Recipes, Tags
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+User = get_user_model()
+
+
+class FoodgramAPITestCase(APITestCase):
+    """
+    Базовый класс тестов API: создание пользователей, тегов,
+    ингридиентов и рецептов в setUpTestData и авторизация по токену
+    """
+
+    @classmethod
+    def create_users(cls, count, prefix="user"):
+        return [
+            User.objects.create_user(
+                username=f"{prefix}{i}",
+                email=f"{prefix}{i}@example.com",
+                password="password",
+                first_name=f"Имя {i}",
+                last_name="Фамилия",
+            )
+            for i in range(count)
+        ]
+
+    @classmethod
+    def create_tags(cls, count=3):
+        return [
+            Tags.objects.create(
+                name=f"Тег {i}", color=f"#00000{i}", slug=f"tag{i}"
+            )
+            for i in range(count)
+        ]
+
+    @classmethod
+    def create_ingredients(cls, count=5):
+        return [
+            Ingredient.objects.create(
+                name=f"Ингредиент {i}", measurement_unit="г"
+            )
+            for i in range(count)
+        ]
+
+    @classmethod
+    def create_recipe(
+        cls, author, tags=(), ingredients=(), amount=1, **kwargs
+    ):
+        """Рецепт с тегами и ингридиентами в количестве amount"""
+
+        recipe = Recipes.objects.create(
+            author=author,
+            **{
+                "name": "Рецепт",
+                "image": "recipes/images/recipe.png",
+                "text": "Описание",
+                "cooking_time": 10,
+                **kwargs,
+            },
+        )
+        if tags:
+            recipe.tags.set(tags)
+        RecipeIngregient.objects.bulk_create(
+            [
+                RecipeIngregient(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+                for ingredient in ingredients
+            ]
+        )
+        return recipe
+
+    def authenticate(self, user):
+        """Запросы клиента с токеном пользователя, None - анонимные"""
+
+        if user is None:
+            self.client.credentials()
+            return
+        token, _ = Token.objects.get_or_create(user=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def assert_budget(self, method, path, status_code=200, **kwargs):
+        """Запрос укладывается в бюджет представления (core.profiling)"""
+
+        response = assert_query_budget(self.client, method, path, **kwargs)
+        self.assertEqual(response.status_code, status_code)
+        return response
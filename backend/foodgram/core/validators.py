@@ -1,5 +1,5 @@
 from django.core.exceptions import ValidationError
-from recipes.models import Tags
+from recipes.models import Ingredient, Tags
 
 
 def tags_exist(tags: list[int]):
@@ -17,10 +17,20 @@ def inrg_exist(ingredients: list[dict]):
     count_ingr = 0
     for ingr in ingredients:
         if (
-            ingr.get("id")
+            str(ingr.get("id")).isdigit()
             and str(ingr.get("amount")).isdigit()
             and int(ingr.get("amount")) > 0
         ):
             count_ingr += 1
     if len(ingredients) != count_ingr:
         raise ValidationError("Ингридиент должен быть задан числом больше 0")
+
+
+def ingredients_exist(ingredients: dict[int, int]):
+    """
+    Проверка на существование ингридиентов одним запросом.
+    На вход принимает словарь {id ингридиента: количество}.
+    """
+    ingredients_check = Ingredient.objects.filter(pk__in=ingredients)
+    if ingredients_check.count() != len(ingredients):
+        raise ValidationError("Ингридиент не найден")
@@ -7,10 +7,41 @@ For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
-application = get_asgi_application()
+
+class ThreadPerRequestMiddleware:
+    """
+    Синхронный код каждого запроса (представления DRF, ORM) выполняется
+    в собственном потоке. Без этого Django 3.2 выполняет синхронный код
+    всех запросов процесса по очереди в одном потоке.
+    Число одновременно обрабатываемых запросов, а значит и потоков,
+    ограничено ASGI_MAX_CONCURRENCY
+    """
+
+    def __init__(self, app, max_concurrency):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self.semaphore is None:
+            # Семафор создается в цикле событий воркера
+            self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self.semaphore:
+            async with ThreadSensitiveContext():
+                return await self.app(scope, receive, send)
+
+
+application = ThreadPerRequestMiddleware(
+    get_asgi_application(),
+    int(os.getenv('ASGI_MAX_CONCURRENCY', default=32)),
+)
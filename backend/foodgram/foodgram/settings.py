@@ -62,6 +62,18 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Заголовки X-Query-Count и Server-Timing и лог запросов, превысивших
+# бюджет запросов к базе (query_budgets представления)
+QUERY_PROFILING = os.getenv("QUERY_PROFILING", default="False") == "True"
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", default=10))
+if QUERY_PROFILING:
+    MIDDLEWARE.insert(0, "core.profiling.QueryProfilingMiddleware")
+
+# Метрики Prometheus по маршрутам и эндпоинт /metrics (core.metrics)
+METRICS = os.getenv("METRICS", default="False") == "True"
+if METRICS:
+    MIDDLEWARE.insert(0, "core.metrics.MetricsMiddleware")
+
 ROOT_URLCONF = "foodgram.urls"
 
 REST_FRAMEWORK = {
@@ -73,6 +85,19 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 6,
 }
 
+# Выдача списка и страницы рецептов и подписок без полей DRF
+# (api.read_serializers), ответ совпадает с обычными сериализаторами
+FAST_READ_SERIALIZERS = (
+    os.getenv("FAST_READ_SERIALIZERS", default="True") == "True"
+)
+
+# Максимальное количество ингридиентов в выдаче поиска
+INGREDIENTS_SEARCH_LIMIT = int(os.getenv("INGREDIENTS_SEARCH_LIMIT", default=50))
+# Поиск ингридиентов по индексу в памяти процесса вместо запросов к базе
+INGREDIENTS_INDEX = os.getenv("INGREDIENTS_INDEX", default="False") == "True"
+# Время жизни индекса ингридиентов в секундах
+INGREDIENTS_INDEX_TTL = int(os.getenv("INGREDIENTS_INDEX_TTL", default=300))
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -94,18 +119,119 @@ WSGI_APPLICATION = "foodgram.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_ENGINE=core.db.postgresql добавляет к стандартному бэкенду проверку
+# соединений (CONN_HEALTH_CHECKS) и пул соединений процесса (POOL),
+# Django 3.2 со стандартным бэкендом эти настройки не использует
+DB_ENGINE = os.getenv("DB_ENGINE", default="django.db.backends.postgresql")
+DB_ENGINE_CHECKED = DB_ENGINE == "core.db.postgresql"
+
+# В режиме ASGI (gunicorn.conf.py) поток живет один запрос, поэтому
+# постоянные соединения заменяются пулом. С пулом соединения остаются
+# в потоках только на время запроса, CONN_MAX_AGE должен быть 0
+SERVER_MODE = os.getenv("SERVER_MODE", default="wsgi")
+DB_POOL = DB_ENGINE_CHECKED and os.getenv(
+    "DB_POOL", default="True" if SERVER_MODE == "asgi" else "False"
+) == "True"
+# Постоянные соединения без проверки разрываются при перезапуске базы,
+# поэтому по умолчанию они включены только с core.db.postgresql
+DB_CONN_MAX_AGE = os.getenv(
+    "DB_CONN_MAX_AGE",
+    default="60"
+    if DB_ENGINE_CHECKED and SERVER_MODE != "asgi" and not DB_POOL
+    else "0",
+)
+
 DATABASES = {
     "default": {
-        "ENGINE": os.getenv(
-            "DB_ENGINE", default="django.db.backends.postgresql"
-        ),
+        "ENGINE": DB_ENGINE,
         "NAME": os.getenv("DB_NAME", default="postgres"),
         "USER": os.getenv("POSTGRES_USER", default="postgres"),
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", default="postgres"),
         "HOST": os.getenv("DB_HOST", default="localhost"),
         "PORT": os.getenv("DB_PORT", default="5432"),
+        # Время жизни соединения в секундах, 0 - закрывать после запроса
+        "CONN_MAX_AGE": int(DB_CONN_MAX_AGE),
     }
 }
+if DB_ENGINE_CHECKED:
+    DATABASES["default"].update(
+        {
+            "CONN_HEALTH_CHECKS": (
+                os.getenv("DB_CONN_HEALTH_CHECKS", default="True") == "True"
+            ),
+            # Пул нужен в режиме ASGI, где у каждого запроса свой поток
+            "POOL": {
+                "MAX_SIZE": int(os.getenv("DB_POOL_MAX_SIZE", default=32)),
+                "IDLE_SIZE": int(os.getenv("DB_POOL_IDLE_SIZE", default=8)),
+                "TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", default=10)),
+            }
+            if DB_POOL
+            else None,
+        }
+    )
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Для Redis: CACHE_BACKEND=django_redis.cache.RedisCache
+# и CACHE_LOCATION=redis://redis:6379/1 (требуется пакет django-redis)
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default="foodgram"),
+    }
+}
+
+# Кэш страниц списка рецептов для анонимных пользователей,
+# время жизни 0 отключает кэш. Поколения страниц хранятся в том же кэше:
+# LocMemCache у каждого процесса свой, смена поколения в одном воркере
+# не видна остальным, поэтому с ним и GUNICORN_WORKERS > 1 кэш по
+# умолчанию выключен, для нескольких воркеров нужен общий кэш (Redis)
+RECIPES_LIST_CACHE = "default"
+RECIPES_LIST_CACHE_TTL = int(
+    os.getenv(
+        "RECIPES_LIST_CACHE_TTL",
+        default=(
+            0
+            if CACHES[RECIPES_LIST_CACHE]["BACKEND"].endswith(".LocMemCache")
+            and int(os.getenv("GUNICORN_WORKERS", default=1)) > 1
+            else 600
+        ),
+    )
+)
+
+# Время жизни кэшированного количества записей для пагинации (count_strategy
+# cached) и порог, с которого используется оценка размера таблицы из
+# статистики Postgres (estimate, только для запросов без фильтров)
+COUNT_CACHE_TTL = int(os.getenv("COUNT_CACHE_TTL", default=60))
+COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv("COUNT_ESTIMATE_THRESHOLD", default=10000)
+)
+
+# Пул потоков фоновых задач, при BACKGROUND_TASKS_EAGER задачи
+# выполняются сразу после фиксации транзакции в потоке запроса
+BACKGROUND_TASKS_WORKERS = int(
+    os.getenv("BACKGROUND_TASKS_WORKERS", default=2)
+)
+BACKGROUND_TASKS_EAGER = (
+    os.getenv("BACKGROUND_TASKS_EAGER", default="False") == "True"
+)
+
+# Варианты картинки рецепта: наибольшая сторона, формат (WEBP, JPEG)
+RECIPE_IMAGE_THUMBNAIL_SIZE = int(
+    os.getenv("RECIPE_IMAGE_THUMBNAIL_SIZE", default=480)
+)
+RECIPE_IMAGE_DETAIL_SIZE = int(
+    os.getenv("RECIPE_IMAGE_DETAIL_SIZE", default=1200)
+)
+RECIPE_IMAGE_FORMAT = os.getenv("RECIPE_IMAGE_FORMAT", default="WEBP")
+RECIPE_IMAGE_QUALITY = int(os.getenv("RECIPE_IMAGE_QUALITY", default=80))
+
+# Максимальное количество id в одном списке пакетных эндпоинтов
+BULK_RELATIONS_LIMIT = int(os.getenv("BULK_RELATIONS_LIMIT", default=500))
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -162,6 +288,10 @@ STATIC_ROOT = BASE_DIR / "static"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Имена файлов по содержимому, одинаковые картинки хранятся один раз
+DEFAULT_FILE_STORAGE = os.getenv(
+    "DEFAULT_FILE_STORAGE", default="core.storage.HashedFileSystemStorage"
+)
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
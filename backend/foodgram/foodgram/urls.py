@@ -1,3 +1,5 @@
+from core.metrics import metrics
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
@@ -5,3 +7,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
 ]
+
+if settings.METRICS:
+    # Снаружи недоступен: nginx не проксирует /metrics
+    urlpatterns.append(path('metrics', metrics, name='metrics'))
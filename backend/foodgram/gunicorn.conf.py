@@ -0,0 +1,36 @@
+import os
+import shutil
+
+# Режим сервера: wsgi (синхронные воркеры) или asgi (воркеры uvicorn)
+SERVER_MODE = os.getenv("SERVER_MODE", default="wsgi")
+
+bind = os.getenv("GUNICORN_BIND", default="0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", default=1))
+
+if SERVER_MODE == "asgi":
+    wsgi_app = "foodgram.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "foodgram.wsgi:application"
+
+# Метрики воркеров собираются в общем каталоге (prometheus_client
+# multiprocess), переменная должна быть задана до запуска воркеров
+if os.getenv("METRICS", default="False") == "True":
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", "/tmp/foodgram-metrics"
+    )
+
+
+def on_starting(server):
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        # Метрики прошлого запуска не должны попасть в новые
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -51,6 +51,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "author",
         "get_count_selected_recipes",
     )
+    list_select_related = ("author",)
     fields = (
         ("name", "cooking_time"),
         ("author", "tags"),
@@ -74,6 +75,7 @@ class RecipeAdmin(admin.ModelAdmin):
         "name",  # название рецепта
         "author",  # автор рецепта
         "tags",  # теги рецепта
+        "get_count_selected_recipes",  # популярность рецепта
     )
 
     empty_value_display = "-пусто-"
@@ -82,11 +84,12 @@ class RecipeAdmin(admin.ModelAdmin):
         """
         Возвращает количество пользователей, добавивших рецепт в избранное
         """
-        return SelectedRecipes.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
     get_count_selected_recipes.short_description = (
         "В избранном у пользователей"
     )
+    get_count_selected_recipes.admin_order_field = "favorites_count"
 
 
 class SelectedRecipesAdmin(admin.ModelAdmin):
@@ -0,0 +1,285 @@
+import json
+import random
+import statistics
+import time
+
+from api.urls import router_v1
+from core.profiling import QueryRecorder, get_query_budget
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import resolve, reverse
+from rest_framework.authtoken.models import Token
+from users.urls import router
+
+User = get_user_model()
+
+# (пространство имен url, роутер)
+ROUTERS = (
+    ("users", router),
+    ("users:api", router_v1),
+)
+# Пары действий, которые можно повторять без изменения данных
+TOGGLE_METHODS = ("post", "delete")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures latency percentiles and database query counts of every "
+        "route of the API routers in-process. GET routes are always "
+        "measured, detail actions with POST and DELETE (favorite, "
+        "subscribe) with --writes. Results can be saved with --output "
+        "and compared with a previous run with --baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Number of requests for each route",
+        )
+        parser.add_argument(
+            "--username",
+            help=(
+                "User for authenticated requests, by default the first "
+                "user with a shopping list"
+            ),
+        )
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=6,
+            help="Page size of paginated lists",
+        )
+        parser.add_argument(
+            "--anonymous",
+            action="store_true",
+            help="Also measure GET routes without authentication",
+        )
+        parser.add_argument(
+            "--writes",
+            action="store_true",
+            help="Also measure POST and DELETE of detail actions",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for object selection"
+        )
+        parser.add_argument("--output", help="Save results to a JSON file")
+        parser.add_argument(
+            "--baseline", help="Compare with results saved by --output"
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("Number of requests must be positive")
+
+        user = self.get_user(options["username"])
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            "user": Client(
+                HTTP_AUTHORIZATION=f"Token {token.key}",
+                HTTP_HOST=self.get_host(),
+                raise_request_exception=False,
+            )
+        }
+        if options["anonymous"]:
+            clients["anonymous"] = Client(
+                HTTP_HOST=self.get_host(), raise_request_exception=False
+            )
+
+        self.rnd = random.Random(options["seed"])
+        self.requests = options["requests"]
+        self.ids = {}
+        self.baseline = self.read_baseline(options["baseline"])
+        self.stdout.write(f"User: {user.username}")
+
+        results = {}
+        skipped = []
+        for namespace, viewset, name, route in self.get_routes():
+            methods = set(route.mapping)
+            if "get" in methods:
+                methods.discard("get")
+                for client_name, client in clients.items():
+                    key = f"GET {name} {client_name}"
+                    results[key] = self.measure(
+                        client, "get", namespace, viewset, name, route,
+                        options["limit"],
+                    )
+                    self.report(key, results[key])
+            if (
+                options["writes"]
+                and route.detail
+                and methods.issuperset(TOGGLE_METHODS)
+            ):
+                methods.difference_update(TOGGLE_METHODS)
+                results.update(
+                    self.measure_toggle(
+                        clients["user"], namespace, viewset, name, route
+                    )
+                )
+            if methods:
+                skipped.append(f"{'/'.join(sorted(methods))} {name}")
+
+        if skipped:
+            self.stdout.write(f"Skipped: {', '.join(skipped)}")
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results saved to {options['output']}")
+
+    def get_routes(self):
+        """Все маршруты роутеров: пространство имен, viewset, имя, маршрут"""
+
+        for namespace, api_router in ROUTERS:
+            for prefix, viewset, basename in api_router.registry:
+                for route in api_router.get_routes(viewset):
+                    name = route.name.format(basename=basename)
+                    yield namespace, viewset, name, route
+
+    def get_url(self, namespace, viewset, name, route, limit):
+        url_kwargs = {}
+        if route.detail:
+            lookup = viewset.lookup_url_kwarg or viewset.lookup_field
+            url_kwargs[lookup] = self.rnd.choice(self.get_ids(viewset))
+        url = reverse(f"{namespace}:{name}", kwargs=url_kwargs)
+        paginator = viewset.pagination_class
+        page_size_param = getattr(paginator, "page_size_query_param", None)
+        if not route.detail and page_size_param and name.endswith("-list"):
+            url += f"?{page_size_param}={limit}"
+        return url
+
+    def get_ids(self, viewset):
+        """Первичные ключи объектов для маршрутов с id, вычисляются раз"""
+
+        model = viewset.queryset.model
+        if model not in self.ids:
+            self.ids[model] = list(
+                model.objects.order_by("pk").values_list("pk", flat=True)[
+                    :1000
+                ]
+            )
+            if not self.ids[model]:
+                raise CommandError(
+                    f"No {model._meta.verbose_name_plural}, "
+                    "run generate_data first"
+                )
+        return self.ids[model]
+
+    def measure(self, client, method, namespace, viewset, name, route, limit):
+        latencies = []
+        queries = []
+        statuses = set()
+        for _ in range(self.requests):
+            url = self.get_url(namespace, viewset, name, route, limit)
+            latency, count, status = self.request(client, method, url)
+            latencies.append(latency)
+            queries.append(count)
+            statuses.add(status)
+        return self.summary(latencies, queries, statuses, url, method)
+
+    def measure_toggle(self, client, namespace, viewset, name, route):
+        """
+        POST и DELETE одного объекта подряд, DELETE выполняется только
+        после успешного POST, поэтому существующие связи не удаляются
+        """
+        measured = {method: ([], [], set()) for method in TOGGLE_METHODS}
+        for _ in range(self.requests):
+            url = self.get_url(namespace, viewset, name, route, None)
+            for method in TOGGLE_METHODS:
+                latency, count, status = self.request(client, method, url)
+                latencies, queries, statuses = measured[method]
+                latencies.append(latency)
+                queries.append(count)
+                statuses.add(status)
+                if status >= 300:
+                    break
+
+        results = {}
+        for method, (latencies, queries, statuses) in measured.items():
+            if latencies:
+                key = f"{method.upper()} {name} user"
+                results[key] = self.summary(
+                    latencies, queries, statuses, url, method
+                )
+                self.report(key, results[key])
+        return results
+
+    @staticmethod
+    def request(client, method, url):
+        """Время ответа, количество запросов к базе и статус ответа"""
+
+        with QueryRecorder() as recorder:
+            started = time.perf_counter()
+            response = getattr(client, method)(url)
+            latency = time.perf_counter() - started
+        return latency, len(recorder.queries), response.status_code
+
+    @staticmethod
+    def summary(latencies, queries, statuses, url, method):
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(
+                latencies, n=100, method="inclusive"
+            )
+        else:
+            percentiles = latencies * 99
+        return {
+            "statuses": sorted(statuses),
+            "queries": max(queries),
+            "budget": get_query_budget(
+                resolve(url.split("?")[0]).func, method
+            ),
+            "p50": percentiles[49] * 1000,
+            "p95": percentiles[94] * 1000,
+            "p99": percentiles[98] * 1000,
+        }
+
+    def report(self, key, result):
+        line = (
+            f"{key}: {','.join(map(str, result['statuses']))} "
+            f"queries {result['queries']}/{result['budget']}, "
+            f"p50 {result['p50']:.1f} ms, p95 {result['p95']:.1f} ms, "
+            f"p99 {result['p99']:.1f} ms"
+        )
+        baseline = self.baseline.get(key)
+        if baseline:
+            change = (result["p50"] / baseline["p50"] - 1) * 100
+            line += (
+                f" (p50 {change:+.0f}%, "
+                f"queries {result['queries'] - baseline['queries']:+d})"
+            )
+        if result["queries"] > result["budget"]:
+            line = self.style.WARNING(line)
+        self.stdout.write(line)
+
+    @staticmethod
+    def read_baseline(path):
+        if not path:
+            return {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Cannot read baseline: {error}")
+
+    @staticmethod
+    def get_user(username):
+        users = User.objects.order_by("pk")
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = (
+                users.filter(shopping_list__isnull=False).first()
+                or users.first()
+            )
+        if user is None:
+            raise CommandError("User not found, run generate_data first")
+        return user
+
+    @staticmethod
+    def get_host():
+        """Хост запросов, который пропустит проверка ALLOWED_HOSTS"""
+
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != "*"]
+        return hosts[0].lstrip(".") if hosts else "localhost"
@@ -0,0 +1,87 @@
+import statistics
+import threading
+import time
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from recipes.models import Tags
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures per-request database latency with the current "
+        "connection settings (DB_CONN_MAX_AGE, DB_POOL), run it with "
+        "different settings to compare them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=500,
+            help="Number of simulated requests",
+        )
+        parser.add_argument(
+            "--thread-per-request",
+            action="store_true",
+            help="Run every request in a new thread, as in ASGI mode",
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("Number of requests must be positive")
+
+        opened = []
+
+        def count_connection(sender, **kwargs):
+            opened.append(sender)
+
+        connection_created.connect(count_connection)
+        latencies = []
+        try:
+            for _ in range(options["requests"]):
+                if options["thread_per_request"]:
+                    thread = threading.Thread(
+                        target=self.request, args=(latencies,)
+                    )
+                    thread.start()
+                    thread.join()
+                else:
+                    self.request(latencies)
+        finally:
+            connection_created.disconnect(count_connection)
+            connections.close_all()
+
+        settings_dict = connection.settings_dict
+        self.stdout.write(
+            f"ENGINE: {settings_dict['ENGINE']}, "
+            f"CONN_MAX_AGE: {settings_dict['CONN_MAX_AGE']}, "
+            f"POOL: {settings_dict.get('POOL')}"
+        )
+        self.stdout.write(
+            f"Requests: {len(latencies)}, "
+            f"new connections: {len(opened)}"
+        )
+        self.stdout.write(
+            f"mean {statistics.mean(latencies) * 1000:.2f} ms, "
+            f"p50 {statistics.median(latencies) * 1000:.2f} ms, "
+            f"max {max(latencies) * 1000:.2f} ms"
+        )
+
+    @staticmethod
+    def request(latencies):
+        """Один запрос: сигналы начала и конца запроса и обращение к базе"""
+
+        request_started.send(sender=WSGIHandler)
+        try:
+            started = time.perf_counter()
+            list(Tags.objects.all()[:1])
+            latencies.append(time.perf_counter() - started)
+        finally:
+            request_finished.send(sender=WSGIHandler)
+            if threading.current_thread() is not threading.main_thread():
+                # Соединения потока не переживают его, как в режиме ASGI
+                connections.close_all()
@@ -0,0 +1,71 @@
+import random
+import time
+
+from api.filters import IngredientSearchFilter
+from core.ingredients_index import ingredients_index
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares ingredient search through the ORM "
+        "with the in-memory ingredients index"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queries",
+            type=int,
+            default=1000,
+            help="Number of search queries for each path",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for query generation"
+        )
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list("name", flat=True))
+        if not names:
+            raise CommandError("No ingredients, run lo_in first")
+
+        rnd = random.Random(options["seed"])
+        queries = []
+        for _ in range(options["queries"]):
+            name = rnd.choice(names)
+            queries.append(name[: rnd.randint(1, min(len(name), 4))])
+
+        limit = settings.INGREDIENTS_SEARCH_LIMIT
+        ingredients_index.invalidate()
+        ingredients_index.search("", limit)
+
+        orm_time = self.measure(
+            lambda name: self.orm_search(name, limit), queries
+        )
+        index_time = self.measure(
+            lambda name: ingredients_index.search(name, limit), queries
+        )
+
+        self.stdout.write(f"Queries: {len(queries)}, limit: {limit}")
+        self.stdout.write(f"ORM:   {orm_time * 1000 / len(queries):.3f} ms")
+        self.stdout.write(f"Index: {index_time * 1000 / len(queries):.3f} ms")
+        self.stdout.write(
+            self.style.SUCCESS(f"Speedup: {orm_time / index_time:.1f}x")
+        )
+
+    @staticmethod
+    def measure(search, queries):
+        started = time.perf_counter()
+        for name in queries:
+            search(name)
+        return time.perf_counter() - started
+
+    @staticmethod
+    def orm_search(name, limit):
+        """Тот же запрос, что выполняет эндпоинт без индекса"""
+
+        return list(
+            IngredientSearchFilter.search(Ingredient.objects.all(), name)
+            .values("id", "name", "measurement_unit")[:limit]
+        )
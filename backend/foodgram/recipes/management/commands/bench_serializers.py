@@ -0,0 +1,193 @@
+import random
+import time
+
+from api.read_serializers import (RecipeReadSerializer,
+                                  SubscriptionReadSerializer)
+from api.serializers import RecipeSerializer
+from api.views import CreateRecipeView
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from django.test import Client, override_settings
+from recipes.models import Recipes, Tags
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.serializers import SubscriptionSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks that the fast read serializers (FAST_READ_SERIALIZERS) "
+        "render byte-identical JSON to the DRF serializers for recipe "
+        "lists, recipe pages and subscriptions, then compares their CPU "
+        "time on a page of recipes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=100,
+            help="Page size of compared and measured lists",
+        )
+        parser.add_argument(
+            "--pages",
+            type=int,
+            default=5,
+            help="Number of list pages to compare",
+        )
+        parser.add_argument(
+            "--recipes",
+            type=int,
+            default=50,
+            help="Number of recipe pages to compare",
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=20,
+            help="Serializations of a page in the benchmark",
+        )
+        parser.add_argument(
+            "--username",
+            help=(
+                "User for authenticated requests, by default the first "
+                "user with subscriptions"
+            ),
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for recipe selection"
+        )
+
+    def handle(self, *args, **options):
+        if min(options["limit"], options["iterations"]) < 1:
+            raise CommandError("Limit and iterations must be positive")
+
+        user = self.get_user(options["username"])
+        self.stdout.write(f"User: {user.username}")
+        self.check_parity(user, options)
+        self.benchmark(user, options)
+
+    def check_parity(self, user, options):
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {
+            "user": Client(HTTP_AUTHORIZATION=f"Token {token.key}"),
+            "anonymous": Client(),
+        }
+        compared = 0
+        for client_name, client in clients.items():
+            for path in self.get_paths(client_name, options):
+                fast = self.get(client, path, fast=True)
+                drf = self.get(client, path, fast=False)
+                if fast != drf:
+                    raise CommandError(
+                        f"Responses differ: GET {path} {client_name}\n"
+                        f"fast: {fast[1][:500]}\ndrf:  {drf[1][:500]}"
+                    )
+                compared += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Parity: {compared} responses identical")
+        )
+
+    def get_paths(self, client_name, options):
+        limit = options["limit"]
+        paths = [
+            f"/api/recipes/?limit={limit}&page={page}"
+            for page in range(1, options["pages"] + 1)
+        ]
+        paths += [
+            f"/api/recipes/?limit={limit}&tags={slug}"
+            for slug in Tags.objects.values_list("slug", flat=True)[:3]
+        ]
+        ids = list(Recipes.objects.values_list("pk", flat=True))
+        rnd = random.Random(options["seed"])
+        paths += [
+            f"/api/recipes/{pk}/"
+            for pk in rnd.sample(ids, min(options["recipes"], len(ids)))
+        ]
+        if client_name == "user":
+            paths += [
+                f"/api/recipes/?limit={limit}&is_favorited=1",
+                f"/api/recipes/?limit={limit}&is_in_shopping_cart=1",
+                f"/api/users/subscriptions/?limit={limit}",
+                f"/api/users/subscriptions/?limit={limit}&recipes_limit=3",
+            ]
+        return paths
+
+    @staticmethod
+    def get(client, path, fast):
+        """Статус и тело ответа, кэш списка рецептов отключен"""
+
+        with override_settings(
+            FAST_READ_SERIALIZERS=fast, RECIPES_LIST_CACHE_TTL=0
+        ):
+            response = client.get(path)
+        return response.status_code, response.content
+
+    def benchmark(self, user, options):
+        request = Request(APIRequestFactory().get("/api/recipes/"))
+        request.user = user
+        view = CreateRecipeView(
+            request=request, action="list", format_kwarg=None
+        )
+        recipes = list(view.get_queryset()[: options["limit"]])
+        context = view.get_serializer_context()
+        authors = list(
+            User.objects.filter(subscriptions__user=user)
+            .prefetch_related(Prefetch("recipes"))
+            .order_by("id")[: options["limit"]]
+        )
+
+        cases = (
+            ("recipes", RecipeSerializer, RecipeReadSerializer, recipes),
+            (
+                "subscriptions",
+                SubscriptionSerializer,
+                SubscriptionReadSerializer,
+                authors,
+            ),
+        )
+        for name, drf_class, fast_class, objects in cases:
+            kwargs = {"context": context} if name == "recipes" else {}
+            drf_time = self.measure(
+                drf_class, objects, kwargs, options["iterations"]
+            )
+            fast_time = self.measure(
+                fast_class, objects, kwargs, options["iterations"]
+            )
+            self.stdout.write(
+                f"{name} ({len(objects)} objects): "
+                f"DRF {drf_time * 1000:.2f} ms, "
+                f"fast {fast_time * 1000:.2f} ms, "
+                f"speedup {drf_time / max(fast_time, 1e-9):.1f}x"
+            )
+
+    @staticmethod
+    def measure(serializer_class, objects, kwargs, iterations):
+        """Процессорное время сериализации и рендеринга страницы"""
+
+        renderer = JSONRenderer()
+        started = time.process_time()
+        for _ in range(iterations):
+            renderer.render(
+                serializer_class(objects, many=True, **kwargs).data
+            )
+        return (time.process_time() - started) / iterations
+
+    @staticmethod
+    def get_user(username):
+        users = User.objects.order_by("pk")
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = (
+                users.filter(subscribers__isnull=False).first()
+                or users.first()
+            )
+        if user is None:
+            raise CommandError("User not found, run generate_data first")
+        return user
@@ -0,0 +1,325 @@
+import io
+import random
+from itertools import accumulate
+
+from api.cache import recipe_list_cache
+from api.models import TableVersion
+from core.ingredients_index import ingredients_index
+from core.params import INGREDIENTS_VERSION, TAGS_VERSION
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+from recipes.models import (Follow, Ingredient, RecipeIngregient, Recipes,
+                            SelectedRecipes, ShoppingList, Tags)
+
+User = get_user_model()
+
+WORDS = (
+    "суп", "салат", "пирог", "каша", "соус", "рагу", "запеканка", "омлет",
+    "паста", "плов", "блины", "котлеты", "томатный", "грибной", "овощной",
+    "куриный", "сырный", "пряный", "быстрый", "домашний", "летний",
+)
+UNITS = ("г", "кг", "мл", "л", "шт", "ст. л.", "ч. л.", "по вкусу")
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates deterministic synthetic users, recipes, follows, "
+        "favorites and shopping lists for benchmarks. The same seed and "
+        "options always produce the same data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=100, help="Number of users"
+        )
+        parser.add_argument(
+            "--recipes", type=int, default=1000, help="Number of recipes"
+        )
+        parser.add_argument(
+            "--tags", type=int, default=8, help="Minimal number of tags"
+        )
+        parser.add_argument(
+            "--ingredients",
+            type=int,
+            default=500,
+            help="Minimal number of ingredients, missing ones are generated",
+        )
+        parser.add_argument(
+            "--ingredients-per-recipe",
+            type=int,
+            nargs=2,
+            default=(3, 12),
+            metavar=("MIN", "MAX"),
+            help="Range of ingredients in a recipe",
+        )
+        parser.add_argument(
+            "--tags-per-recipe",
+            type=int,
+            nargs=2,
+            default=(1, 3),
+            metavar=("MIN", "MAX"),
+            help="Range of tags of a recipe",
+        )
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=10,
+            help="Average number of follows of a user",
+        )
+        parser.add_argument(
+            "--favorites",
+            type=int,
+            default=20,
+            help="Average number of favorite recipes of a user",
+        )
+        parser.add_argument(
+            "--cart",
+            type=int,
+            default=5,
+            help="Average number of recipes in a shopping list",
+        )
+        parser.add_argument(
+            "--seed", type=int, default=0, help="Seed for data generation"
+        )
+        parser.add_argument(
+            "--prefix",
+            default="bench",
+            help="Prefix of generated usernames, tags and ingredients",
+        )
+        parser.add_argument(
+            "--password",
+            default="bench-password",
+            help="Password of generated users",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted by one query",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 2 or options["recipes"] < 1:
+            raise CommandError("At least 2 users and 1 recipe are required")
+        for name in ("ingredients_per_recipe", "tags_per_recipe"):
+            low, high = options[name]
+            if not 1 <= low <= high:
+                raise CommandError(f"Invalid range {low} {high}")
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(
+                f"Users with prefix {prefix} already exist, "
+                "run flush or use another --prefix"
+            )
+
+        self.rnd = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        with transaction.atomic():
+            tags = self.ensure_tags(prefix, options["tags"])
+            ingredients = self.ensure_ingredients(
+                prefix, options["ingredients"]
+            )
+            self.generate(prefix, tags, ingredients, options)
+
+        ingredients_index.invalidate()
+        TableVersion.bump(TAGS_VERSION, INGREDIENTS_VERSION)
+        recipe_list_cache.invalidate(everything=True)
+        self.stdout.write(self.style.SUCCESS("Data generated successfully"))
+
+    def generate(self, prefix, tags, ingredients, options):
+        rnd = self.rnd
+        user_count = options["users"]
+        recipe_count = options["recipes"]
+
+        # Популярность авторов и рецептов распределена по закону Ципфа:
+        # немногие авторы пишут и собирают большую часть рецептов
+        author_weights = self.zipf_weights(user_count)
+        recipe_weights = self.zipf_weights(recipe_count)
+        authors = rnd.choices(
+            range(user_count), cum_weights=author_weights, k=recipe_count
+        )
+
+        follows = set()
+        favorites = set()
+        cart = set()
+        for user in range(user_count):
+            for author in self.sample(
+                author_weights, options["follows"], exclude=user
+            ):
+                follows.add((user, author))
+            for recipe in self.sample(recipe_weights, options["favorites"]):
+                favorites.add((user, recipe))
+            for recipe in self.sample(recipe_weights, options["cart"]):
+                cart.add((user, recipe))
+
+        recipes_count = [0] * user_count
+        for author in authors:
+            recipes_count[author] += 1
+        favorites_count = [0] * recipe_count
+        for _, recipe in favorites:
+            favorites_count[recipe] += 1
+        cart_count = [0] * recipe_count
+        for _, recipe in cart:
+            cart_count[recipe] += 1
+
+        password = make_password(options["password"])
+        self.bulk_create(
+            User(
+                username=f"{prefix}_{number}",
+                email=f"{prefix}_{number}@example.com",
+                first_name=f"Имя{number}",
+                last_name=f"Фамилия{number}",
+                password=password,
+                recipes_count=recipes_count[number],
+            )
+            for number in range(user_count)
+        )
+        user_ids = dict(
+            User.objects.filter(username__startswith=f"{prefix}_")
+            .values_list("username", "pk")
+        )
+        users = [
+            user_ids[f"{prefix}_{number}"] for number in range(user_count)
+        ]
+        self.stdout.write(f"Users: {user_count}")
+
+        image = self.save_image()
+        self.bulk_create(
+            Recipes(
+                name=f"{self.words(2).capitalize()} №{number}",
+                author_id=users[authors[number]],
+                image=image,
+                image_thumbnail=image,
+                image_detail=image,
+                text=self.words(rnd.randint(5, 20)).capitalize(),
+                cooking_time=rnd.randint(5, 180),
+                favorites_count=favorites_count[number],
+                cart_count=cart_count[number],
+            )
+            for number in range(recipe_count)
+        )
+        recipe_ids = dict(
+            Recipes.objects.filter(author_id__in=users)
+            .values_list("name", "pk")
+        )
+        recipes = [
+            recipe_ids[name]
+            for name in sorted(
+                recipe_ids, key=lambda name: int(name.rsplit("№", 1)[1])
+            )
+        ]
+        self.stdout.write(f"Recipes: {recipe_count}")
+
+        self.bulk_create(
+            RecipeIngregient(
+                recipe_id=recipe,
+                ingredient_id=ingredient,
+                amount=rnd.randint(1, 500),
+            )
+            for recipe in recipes
+            for ingredient in rnd.sample(
+                ingredients,
+                min(
+                    rnd.randint(*options["ingredients_per_recipe"]),
+                    len(ingredients),
+                ),
+            )
+        )
+        self.bulk_create(
+            Recipes.tags.through(recipes_id=recipe, tags_id=tag)
+            for recipe in recipes
+            for tag in rnd.sample(
+                tags,
+                min(rnd.randint(*options["tags_per_recipe"]), len(tags)),
+            )
+        )
+        self.bulk_create(
+            Follow(user_id=users[user], author_id=users[author])
+            for user, author in sorted(follows)
+        )
+        self.bulk_create(
+            SelectedRecipes(user_id=users[user], recipe_id=recipes[recipe])
+            for user, recipe in sorted(favorites)
+        )
+        self.bulk_create(
+            ShoppingList(user_id=users[user], recipe_id=recipes[recipe])
+            for user, recipe in sorted(cart)
+        )
+        self.stdout.write(
+            f"Follows: {len(follows)}, favorites: {len(favorites)}, "
+            f"shopping list: {len(cart)}"
+        )
+
+    def ensure_tags(self, prefix, count):
+        """id тегов, недостающие до count теги создаются"""
+
+        existing = Tags.objects.count()
+        Tags.objects.bulk_create(
+            Tags(
+                name=f"{prefix} тег {number}",
+                color=f"#{self.rnd.randrange(16 ** 6):06X}{number:04d}",
+                slug=f"{prefix}-{number}",
+            )
+            for number in range(existing, count)
+        )
+        return list(Tags.objects.order_by("pk").values_list("pk", flat=True))
+
+    def ensure_ingredients(self, prefix, count):
+        """id ингридиентов, недостающие до count ингридиенты создаются"""
+
+        existing = Ingredient.objects.count()
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(
+                    name=f"{prefix} {self.words(1)} {number}",
+                    measurement_unit=self.rnd.choice(UNITS),
+                )
+                for number in range(existing, count)
+            ),
+            batch_size=self.batch_size,
+        )
+        return list(
+            Ingredient.objects.order_by("pk").values_list("pk", flat=True)
+        )
+
+    def bulk_create(self, objects):
+        objects = list(objects)
+        if objects:
+            type(objects[0]).objects.bulk_create(
+                objects, batch_size=self.batch_size
+            )
+
+    def save_image(self):
+        """Одна картинка на все рецепты: файлы не нужны для замеров"""
+
+        buffer = io.BytesIO()
+        Image.new("RGB", (64, 64), (200, 120, 60)).save(buffer, "PNG")
+        field = Recipes._meta.get_field("image")
+        return field.storage.save(
+            field.generate_filename(None, "bench.png"),
+            ContentFile(buffer.getvalue()),
+        )
+
+    def words(self, count):
+        return " ".join(self.rnd.choice(WORDS) for _ in range(count))
+
+    @staticmethod
+    def zipf_weights(count):
+        """Накопленные веса рангов 1..count по закону Ципфа"""
+
+        return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+    def sample(self, cum_weights, average, exclude=None):
+        """
+        Случайный набор индексов с весами cum_weights, размер набора
+        равномерно распределен от 0 до 2 * average
+        """
+        size = self.rnd.randint(0, 2 * average)
+        chosen = self.rnd.choices(
+            range(len(cum_weights)), cum_weights=cum_weights, k=size
+        )
+        return {index for index in chosen if index != exclude}
@@ -1,21 +1,116 @@
 import csv
+import hashlib
+import json
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from api.models import TableVersion
+from core.ingredients_index import ingredients_index
+from core.params import INGREDIENTS_VERSION
+from django.core.management.base import BaseCommand, CommandError
 from recipes.models import Ingredient
 
+DEFAULT_PATH = "./data/ingredients.csv"
+DEFAULT_BATCH_SIZE = 500
+CHUNK_SIZE = 64 * 1024
+
 
 class Command(BaseCommand):
-    help = "Loads ingredients from a CSV file"
+    help = "Loads ingredients from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--path",
+            default=DEFAULT_PATH,
+            help="Path to the .csv or .json file with ingredients",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help="Number of rows inserted by one query",
+        )
+        parser.add_argument(
+            "--skip-if-unchanged",
+            action="store_true",
+            help="Skip loading if the file checksum matches the last load",
+        )
 
     def handle(self, *args, **options):
+        path = Path(options["path"])
+        batch_size = options["batch_size"]
+        if not path.exists():
+            raise CommandError(f"File {path} not found")
+        if batch_size < 1:
+            raise CommandError("Batch size must be a positive number")
+
+        # Сумма хранится в базе, а не рядом с файлом: файл лежит в образе
+        # и пересоздается вместе с контейнером
+        checksum = self.get_checksum(path)
+        if (
+            options["skip_if_unchanged"]
+            and TableVersion.objects.filter(
+                name=INGREDIENTS_VERSION, checksum=checksum
+            ).exists()
+            and Ingredient.objects.exists()
+        ):
+            self.stdout.write("Ingredients are unchanged, skipping")
+            return
+
         self.stdout.write("Loading ingredients...")
-        path_to_csv = "./data/ingredients.csv"
-        with open(path_to_csv, "r", encoding="utf-8") as f:
-            reader = csv.reader(f)
-            for row in reader:
-                Ingredient.objects.update_or_create(
-                    name=row[0], measurement_unit=row[1]
-                )
+        rows = self.unique_rows(self.read_rows(path))
+        processed = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+            processed += len(batch)
+            self.stdout.write(f"Processed {processed} ingredients")
+
+        ingredients_index.invalidate()
+        TableVersion.bump(INGREDIENTS_VERSION)
+        TableVersion.objects.filter(name=INGREDIENTS_VERSION).update(
+            checksum=checksum
+        )
         self.stdout.write(
             self.style.SUCCESS("Ingredients loaded successfully")
         )
+
+    @staticmethod
+    def get_checksum(path):
+        """Контрольная сумма файла, читаемого по частям"""
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def read_rows(path):
+        """Построчно отдает пары (название, единица измерения)"""
+
+        with open(path, "r", encoding="utf-8") as f:
+            if path.suffix == ".json":
+                for row in json.load(f):
+                    yield row["name"], row["measurement_unit"]
+            else:
+                for row in csv.reader(f):
+                    yield row[0], row[1]
+
+    @staticmethod
+    def unique_rows(rows):
+        """Отбрасывает повторяющиеся в файле ингридиенты"""
+
+        seen = set()
+        for row in rows:
+            if row not in seen:
+                seen.add(row)
+                yield row
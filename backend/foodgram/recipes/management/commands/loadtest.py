@@ -0,0 +1,104 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = (
+    "/api/recipes/?limit=6",
+    "/api/recipes/?limit=6&tags=breakfast",
+    "/api/tags/",
+    "/api/ingredients/?name=со",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends concurrent GET requests to a running server and reports "
+        "throughput and latency percentiles, for example to compare "
+        "SERVER_MODE=wsgi with SERVER_MODE=asgi"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://localhost:8000",
+            help="Base URL of the server",
+        )
+        parser.add_argument(
+            "--path",
+            action="append",
+            dest="paths",
+            help="Path to request, can be repeated",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Number of simultaneous clients",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=200,
+            help="Number of requests for each path",
+        )
+        parser.add_argument(
+            "--token", help="Auth token for authenticated endpoints"
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("Concurrency and requests must be positive")
+
+        headers = {}
+        if options["token"]:
+            headers["Authorization"] = f"Token {options['token']}"
+
+        for path in options["paths"] or DEFAULT_PATHS:
+            url = options["url"].rstrip("/") + quote(path, safe="/?&=")
+            self.run(url, headers, options["concurrency"], options["requests"])
+
+    def run(self, url, headers, concurrency, requests):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(
+                executor.map(
+                    lambda _: self.fetch(url, headers), range(requests)
+                )
+            )
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, ok in results if ok)
+        errors = len(results) - len(latencies)
+        self.stdout.write(url)
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"  all {errors} failed"))
+            return
+
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(
+                latencies, n=100, method="inclusive"
+            )
+        else:
+            percentiles = latencies * 99
+        self.stdout.write(
+            f"  {len(results) / elapsed:.1f} req/s, errors: {errors}, "
+            f"p50 {percentiles[49] * 1000:.1f} ms, "
+            f"p95 {percentiles[94] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms"
+        )
+
+    @staticmethod
+    def fetch(url, headers):
+        """Время ответа и признак успешного запроса"""
+
+        started = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers=headers), timeout=30) as resp:
+                resp.read()
+        except OSError:
+            return time.perf_counter() - started, False
+        return time.perf_counter() - started, True
@@ -0,0 +1,32 @@
+from core.images import process_recipe_image
+from django.core.management.base import BaseCommand
+from recipes.models import Recipes
+
+
+class Command(BaseCommand):
+    help = "Builds missing image variants of recipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild variants of all recipes",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipes.objects.all()
+        if not options["all"]:
+            recipes = recipes.filter(image_thumbnail="")
+
+        processed = 0
+        for pk, image in recipes.values_list("pk", "image").iterator():
+            try:
+                process_recipe_image(pk, image)
+            except OSError as error:
+                self.stderr.write(f"Recipe {pk}: {error}")
+                continue
+            processed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Processed {processed} recipe images")
+        )
@@ -0,0 +1,56 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from recipes.models import Recipes, SelectedRecipes, ShoppingList
+
+User = get_user_model()
+
+# (модель со счетчиком, поле счетчика, подсчитываемая модель, связь)
+COUNTERS = (
+    (Recipes, "favorites_count", SelectedRecipes, "recipe"),
+    (Recipes, "cart_count", ShoppingList, "recipe"),
+    (User, "recipes_count", Recipes, "author"),
+)
+
+
+class Command(BaseCommand):
+    help = "Recalculates denormalized counters that drifted from actual data"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted counters without fixing them",
+        )
+
+    def handle(self, *args, **options):
+        for model, field, counted_model, relation in COUNTERS:
+            actual = self.count_subquery(counted_model, relation)
+            drifted = list(
+                model.objects.annotate(actual=actual)
+                .exclude(**{field: F("actual")})
+                .values_list("pk", flat=True)
+            )
+            if drifted and not options["dry_run"]:
+                model.objects.filter(pk__in=drifted).update(**{field: actual})
+            self.stdout.write(
+                f"{model._meta.label}.{field}: {len(drifted)} drifted"
+            )
+
+        self.stdout.write(self.style.SUCCESS("Counters reconciled"))
+
+    @staticmethod
+    def count_subquery(model, relation):
+        """Количество связанных записей для строки внешнего запроса"""
+
+        return Coalesce(
+            Subquery(
+                model.objects.filter(**{relation: OuterRef("pk")})
+                .order_by()
+                .values(relation)
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            Value(0),
+        )
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:50
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Оставляет один ингридиент на пару (название, единица измерения).
+    Ингридиенты рецептов переносятся на оставшуюся запись, если в рецепте
+    она уже есть, количества складываются
+    """
+    Ingredient = apps.get_model("recipes", "Ingredient")
+    RecipeIngregient = apps.get_model("recipes", "RecipeIngregient")
+    groups = (
+        Ingredient.objects.order_by()
+        .values("name", "measurement_unit")
+        .annotate(keep_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        keep_id = group["keep_id"]
+        duplicate_ids = list(
+            Ingredient.objects.filter(
+                name=group["name"],
+                measurement_unit=group["measurement_unit"],
+            )
+            .exclude(id=keep_id)
+            .values_list("id", flat=True)
+        )
+        for row in RecipeIngregient.objects.filter(
+            ingredient_id__in=duplicate_ids
+        ).order_by("id"):
+            kept = RecipeIngregient.objects.filter(
+                recipe_id=row.recipe_id, ingredient_id=keep_id
+            ).first()
+            if kept is None:
+                row.ingredient_id = keep_id
+                row.save(update_fields=["ingredient"])
+            else:
+                kept.amount += row.amount
+                kept.save(update_fields=["amount"])
+                row.delete()
+        Ingredient.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_measurement_unit'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:05
+
+from django.db import migrations
+
+INDEX_NAME = "recipes_ingredient_name_trgm"
+
+
+def create_trgm_index(apps, schema_editor):
+    """Триграммный индекс для поиска ингридиентов, только для Postgres"""
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)"
+    )
+
+
+def drop_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_ingredient_unique_ingredient_measurement_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trgm_index, drop_trgm_index),
+    ]
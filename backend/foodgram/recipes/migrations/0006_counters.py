@@ -0,0 +1,53 @@
+# Generated by Django 3.2.18 on 2026-10-18 19:59
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        Value(0),
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipes = apps.get_model("recipes", "Recipes")
+    SelectedRecipes = apps.get_model("recipes", "SelectedRecipes")
+    ShoppingList = apps.get_model("recipes", "ShoppingList")
+    User = apps.get_model("users", "User")
+
+    Recipes.objects.update(
+        favorites_count=count_subquery(SelectedRecipes, "recipe"),
+        cart_count=count_subquery(ShoppingList, "recipe"),
+    )
+    User.objects.update(recipes_count=count_subquery(Recipes, "author"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipes_pub_date_id_idx'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# (модель, счетчик рецепта)
+RELATIONS = (
+    ("SelectedRecipes", "favorites_count"),
+    ("ShoppingList", "cart_count"),
+)
+
+
+def delete_duplicates(apps, schema_editor):
+    """Оставляет одну запись на пару (пользователь, рецепт)"""
+    Recipes = apps.get_model("recipes", "Recipes")
+    for model_name, counter in RELATIONS:
+        model = apps.get_model("recipes", model_name)
+        first_ids = (
+            model.objects.order_by()
+            .values("user", "recipe")
+            .annotate(first_id=Min("id"))
+            .values("first_id")
+        )
+        deleted, _ = model.objects.exclude(id__in=first_ids).delete()
+        if not deleted:
+            continue
+        Recipes.objects.update(
+            **{
+                counter: Coalesce(
+                    Subquery(
+                        model.objects.filter(recipe=OuterRef("pk"))
+                        .order_by()
+                        .values("recipe")
+                        .annotate(count=Count("pk"))
+                        .values("count")
+                    ),
+                    Value(0),
+                )
+            }
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='selectedrecipes',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_selected_recipe'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglist',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_list_recipe'),
+        ),
+    ]
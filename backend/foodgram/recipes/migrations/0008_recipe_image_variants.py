@@ -0,0 +1,23 @@
+# Generated by Django 3.2.18 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_unique_selected_shopping_list'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipes',
+            name='image_detail',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Картинка для страницы рецепта'),
+        ),
+        migrations.AddField(
+            model_name='recipes',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipes/variants/', verbose_name='Миниатюра для списка'),
+        ),
+    ]
@@ -59,6 +59,12 @@ class Ingredient(models.Model):
         verbose_name = "Ингридиент"
         verbose_name_plural = "Ингридиенты"
         ordering = ("name",)
+        constraints = (
+            models.UniqueConstraint(
+                fields=("name", "measurement_unit"),
+                name="unique_ingredient_measurement_unit",
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -114,6 +120,19 @@ class Recipes(models.Model):
     image = models.ImageField(
         upload_to="recipes/", null=False, verbose_name="Изображение рецепта"
     )
+    # Уменьшенные варианты картинки строятся в фоне (core.images)
+    image_thumbnail = models.ImageField(
+        upload_to="recipes/variants/",
+        blank=True,
+        editable=False,
+        verbose_name="Миниатюра для списка",
+    )
+    image_detail = models.ImageField(
+        upload_to="recipes/variants/",
+        blank=True,
+        editable=False,
+        verbose_name="Картинка для страницы рецепта",
+    )
     text = models.TextField(
         max_length=200, null=False, verbose_name="Текст рецепта"
     )
@@ -148,11 +167,25 @@ class Recipes(models.Model):
         related_name="recipes",
         verbose_name="Ингридиенты",
     )
+    # Счетчики обновляются сигналами (core.signals),
+    # расхождения исправляет команда reconcile_counters
+    favorites_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В избранном"
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="В списках покупок"
+    )
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ("-pub_date",)
+        indexes = (
+            # keyset пагинация ленты рецептов
+            models.Index(
+                fields=("-pub_date", "-id"), name="recipes_pub_date_id_idx"
+            ),
+        )
         constraints = (
             models.UniqueConstraint(
                 fields=("name", "author"),
@@ -186,6 +219,12 @@ class SelectedRecipes(models.Model):
         verbose_name = "Избранный рецепт"
         verbose_name_plural = "Избранные рецепты"
         ordering = ("user",)
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="unique_selected_recipe",
+            ),
+        )
 
     def __str__(self):
         return f"Пользователь {self.user.username} - {self.recipe.name}"
@@ -253,6 +292,12 @@ class ShoppingList(models.Model):
         verbose_name = "Список покупок"
         verbose_name_plural = "Списки покупок"
         ordering = ("user",)
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "recipe"),
+                name="unique_shopping_list_recipe",
+            ),
+        )
 
     def __str__(self):
         return (
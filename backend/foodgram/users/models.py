@@ -20,3 +20,7 @@ class User(AbstractUser):
     groups = models.ManyToManyField(
         Group, verbose_name="Группы", related_name="user_grups", blank=True
     )
+    # Обновляется сигналами (core.signals)
+    recipes_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name="Количество рецептов"
+    )
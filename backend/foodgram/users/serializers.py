@@ -1,3 +1,5 @@
+from api.fields import THUMBNAIL, RecipeImageField
+from core.metrics import MeasuredSerializerMixin
 from core.params import SUBSCRIBED
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
@@ -9,7 +11,7 @@ from rest_framework import serializers
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(MeasuredSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для получения информации о пользователе"""
 
     is_subscribed = serializers.SerializerMethodField()
@@ -78,6 +80,8 @@ class MyUserCreateSerializer(UserCreateSerializer):
 class SubcriptionRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для рецептов в подписках"""
 
+    image = RecipeImageField(variant=THUMBNAIL, read_only=True)
+
     class Meta:
         model = Recipes
         fields = (
@@ -92,7 +96,7 @@ class SubcriptionRecipeSerializer(serializers.ModelSerializer):
 class SubscriptionSerializer(UserSerializer):
     """Сериализатор для подписок"""
 
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = SubcriptionRecipeSerializer(many=True, read_only=True)
 
     class Meta:
@@ -109,8 +113,5 @@ class SubscriptionSerializer(UserSerializer):
         )
         read_only_fields = ("__all__",)
 
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
-
     def get_is_subscribed(self, obj):
         return True
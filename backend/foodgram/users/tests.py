@@ -0,0 +1,58 @@
+from core.testing import FoodgramAPITestCase
+from recipes.models import Follow
+
+
+class UserQueryBudgetTest(FoodgramAPITestCase):
+    """Маршруты users укладываются в бюджеты запросов представлений"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, *cls.authors = cls.create_users(6)
+        for author in cls.authors:
+            for i in range(4):
+                cls.create_recipe(author, name=f"Рецепт {i}")
+        for author in cls.authors[:3]:
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.authenticate(self.user)
+
+    def test_read_routes(self):
+        for path in (
+            "/api/users/",
+            "/api/users/?limit=3&page=2",
+            f"/api/users/{self.authors[0].pk}/",
+            "/api/users/me/",
+            "/api/users/subscriptions/",
+            "/api/users/subscriptions/?recipes_limit=2",
+        ):
+            with self.subTest(path=path):
+                self.assert_budget("GET", path)
+
+    def test_read_routes_anonymous(self):
+        self.authenticate(None)
+        for path, status_code in (
+            ("/api/users/", 200),
+            (f"/api/users/{self.authors[0].pk}/", 200),
+            ("/api/users/me/", 401),
+            ("/api/users/subscriptions/", 401),
+        ):
+            with self.subTest(path=path):
+                self.assert_budget("GET", path, status_code=status_code)
+
+    def test_subscribe_routes(self):
+        path = f"/api/users/{self.authors[4].pk}/subscribe/"
+        response = self.assert_budget(
+            "POST", f"{path}?recipes_limit=2", status_code=201
+        )
+        self.assertEqual(len(response.data["recipes"]), 2)
+        self.assert_budget("DELETE", path, status_code=204)
+        self.assert_budget(
+            "POST",
+            "/api/users/subscribe/bulk/",
+            data={
+                "add": [author.pk for author in self.authors[3:]],
+                "remove": [author.pk for author in self.authors[:2]],
+            },
+            format="json",
+        )
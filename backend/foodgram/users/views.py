@@ -1,12 +1,15 @@
 from api.mixins import AddManyToManyFieldMixin
 from api.paginators import PageLimitPagination
+from api.read_serializers import SubscriptionReadSerializer
 from core.params import SUBSCRIBED, UrlParams
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import OuterRef, Prefetch, Subquery
 from djoser.views import UserViewSet
-from recipes.models import Follow
+from recipes.models import Follow, Recipes
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from users.serializers import SubscriptionSerializer
 
@@ -18,6 +21,19 @@ class MyUserViewSet(UserViewSet, AddManyToManyFieldMixin):
 
     pagination_class = PageLimitPagination
     serializers_for_mixin = SubscriptionSerializer
+    query_budgets = {
+        "list": 4,
+        "retrieve": 3,
+        "me": 1,
+        "subscriptions": 6,
+        "subscribe": 6,
+        "subscribe_bulk": 6,
+    }
+
+    def get_permissions(self):
+        if self.action == "me":
+            self.permission_classes = (IsAuthenticated,)
+        return super().get_permissions()
 
     def get_serializer_context(self):
         """
@@ -26,35 +42,54 @@ class MyUserViewSet(UserViewSet, AddManyToManyFieldMixin):
         """
 
         context = super().get_serializer_context()
-        context[SUBSCRIBED] = self.request.user.subscribers.values_list(
-            "author_id", flat=True
-        )
+        if self.request.user.is_authenticated:
+            context[SUBSCRIBED] = self.request.user.subscribers.values_list(
+                "author_id", flat=True
+            )
         return context
 
+    def get_recipes_limit(self):
+        """Значение параметра recipes_limit или None, если он не задан"""
+
+        params = self.request.query_params.get(UrlParams.RECIPES_LIMIT.value)
+        if params and params.isdigit():
+            return int(params)
+        return None
+
     @action(detail=False, methods=("get",), url_path="subscriptions")
     def subscriptions(self, request, *args, **kwargs):
         """
         Возвращает пользователей, на которых подписан текущий пользователь.
-        В выдачу добавляются рецепты ограниченные параметром recipes_limit.
+        В выдачу добавляются рецепты ограниченные параметром recipes_limit,
+        ограничение рецептов выполняется в базе данных, количество
+        берется из счетчика recipes_count
         """
         if request.user.is_anonymous:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
-        queryset_user = User.objects.filter(
-            subscriptions__user=self.request.user
-        )
-        page = self.paginate_queryset(queryset_user.order_by("id"))
-        serializer = SubscriptionSerializer(page, many=True)
 
-        params = request.query_params.get(UrlParams.RECIPES_LIMIT.value)
+        recipes = Recipes.objects.only(
+            "id", "name", "image", "image_thumbnail", "cooking_time",
+            "author_id"
+        )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(
+                pk__in=Subquery(
+                    Recipes.objects.filter(
+                        author=OuterRef("author")
+                    ).values("pk")[:recipes_limit]
+                )
+            )
 
-        try:
-            if params:
-                serializer.data[0]["recipes"] = serializer.data[0]["recipes"][
-                    : int(params)
-                ]
-        except IndexError:
-            # Обработка случая пустого списка рецептов
-            pass
+        queryset_user = (
+            User.objects.filter(subscriptions__user=self.request.user)
+            .prefetch_related(Prefetch("recipes", queryset=recipes))
+        )
+        page = self.paginate_queryset(queryset_user.order_by("id"))
+        if settings.FAST_READ_SERIALIZERS:
+            serializer = SubscriptionReadSerializer(page, many=True)
+        else:
+            serializer = SubscriptionSerializer(page, many=True)
 
         return self.get_paginated_response(serializer.data)
 
@@ -68,19 +103,32 @@ class MyUserViewSet(UserViewSet, AddManyToManyFieldMixin):
         в параметре recipes_limit.
         """
         request_response = self.delete_create_many_to_many(
-            id, Follow, Q(author=id)
+            id, Follow, "author"
         )
 
-        params = request.query_params.get(UrlParams.RECIPES_LIMIT.value)
+        recipes_limit = self.get_recipes_limit()
 
         if (
-            params
+            recipes_limit is not None
             and request.method == "POST"
             and request_response.status_code == 201
             and request_response.data.get("recipes")
         ):
             request_response.data["recipes"] = request_response.data[
                 "recipes"
-            ][: int(params)]
+            ][:recipes_limit]
 
         return request_response
+
+    @action(
+        detail=False,
+        methods=("post",),
+        url_path="subscribe/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    def subscribe_bulk(self, request, *args, **kwargs):
+        """
+        Пакетная подписка и отписка от авторов,
+        тело запроса: {"add": [id, ...], "remove": [id, ...]}
+        """
+        return self.bulk_many_to_many(Follow, "author")